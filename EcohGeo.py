@@ -1,17 +1,108 @@
 import sys
-import os
-import pandas as pd
-import folium
-from folium.plugins import MarkerCluster
-import simplekml
-import random
+import json
+import time
 from PyQt5.QtWidgets import (QApplication, QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QFileDialog, 
                              QLabel, QComboBox, QDoubleSpinBox, QCheckBox, QDialog, QColorDialog,
-                             QDateTimeEdit)
-from PyQt5.QtCore import Qt, QUrl, QDateTime
+                             QDateTimeEdit, QListWidget, QListWidgetItem, QProgressBar)
+from PyQt5.QtCore import Qt, QUrl, QDateTime, QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
+from PyQt5.QtWebChannel import QWebChannel
 from PyQt5.QtWebEngineWidgets import QWebEngineView
 from PyQt5.QtGui import QColor
 
+from geo_engine import GeoEngine
+from geo_map import describe_cache, open_map_cache
+
+
+class MapBridge(QObject):
+    # Shared with the map page through QWebChannel as "ecohBridge". The page calls ready()
+    # once connected; from then on filtered points are pushed with the update signal.
+    update = pyqtSignal(str)
+
+    def __init__(self):
+        super().__init__()
+        self.is_ready = False
+
+    @pyqtSlot()
+    def ready(self):
+        self.is_ready = True
+
+
+class JobSignals(QObject):
+    progress = pyqtSignal(int)
+    preview = pyqtSignal(object)
+    done = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    finished = pyqtSignal()
+
+
+class Job(QRunnable):
+    # One unit of background work. func receives the job so it can report progress and
+    # check `cancelled` between stages; results of a cancelled job are never delivered.
+    def __init__(self, kind, func):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.kind = kind
+        self.func = func
+        self.signals = JobSignals()
+        self.cancelled = False
+        self.submitted = time.perf_counter()
+        self.latency = None  # Seconds spent waiting in the queue
+
+    def run(self):
+        self.latency = time.perf_counter() - self.submitted
+        try:
+            if not self.cancelled:
+                result = self.func(self)
+                if not self.cancelled:
+                    self.signals.done.emit(result)
+        except Exception as e:
+            if not self.cancelled:
+                self.signals.failed.emit(str(e))
+        finally:
+            self.signals.finished.emit()
+
+
+class JobRunner:
+    # Runs jobs on a single background thread, in order. Submitting a job cancels the
+    # previous job of the same kind, so rapid re-filters collapse into the last one.
+    def __init__(self):
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(1)
+        self.current = {}
+        self.active = set()  # Keeps jobs (and their signals) alive until they finish
+
+    def submit(self, kind, func, on_done, on_failed, on_progress=None, on_preview=None):
+        # Every handler is connected before the job starts: a fast job could otherwise
+        # emit its preview or first progress value before anyone is listening
+        self.cancel(kind)
+        job = Job(kind, func)
+        job.signals.done.connect(lambda result: None if job.cancelled else on_done(job, result))
+        job.signals.failed.connect(lambda message: None if job.cancelled else on_failed(message))
+        if on_progress is not None:
+            job.signals.progress.connect(lambda value: None if job.cancelled else on_progress(value))
+        if on_preview is not None:
+            job.signals.preview.connect(lambda preview: None if job.cancelled else on_preview(preview))
+        job.signals.finished.connect(lambda: self.active.discard(job))
+        self.current[kind] = job
+        self.active.add(job)
+        self.pool.start(job)
+        return job
+
+    def cancel(self, kind):
+        job = self.current.pop(kind, None)
+        if job is not None:
+            job.cancelled = True
+            # Still queued: drop it without running
+            if self.pool.tryTake(job):
+                self.active.discard(job)
+
+    def wait(self):
+        self.pool.waitForDone()
+
+
+def describe_latency(job):
+    return f'Espera en cola: {job.latency * 1000:,.0f} ms.'
+
 
 class MapWindow(QDialog):
     def __init__(self, parent=None):
@@ -32,6 +123,12 @@ class MapWindow(QDialog):
         
         self.map_view = QWebEngineView()
         layout.addWidget(self.map_view)
+
+        # Channel used to update the loaded page in place (see geo_map.LiveMarkers)
+        self.bridge = MapBridge()
+        self.channel = QWebChannel()
+        self.channel.registerObject('ecohBridge', self.bridge)
+        self.map_view.page().setWebChannel(self.channel)
         self.setLayout(layout)
         self.resize(800, 600)
     def on_map_type_changed(self, map_type):
@@ -41,12 +138,17 @@ class MapWindow(QDialog):
 class CoordPlotter(QWidget):
     def __init__(self):
         super().__init__()
-        self.df = None
+        self.engine = None  # GeoEngine of the loaded file (data, indexes, map building)
         self.map = None
         self.marker_color = "#3388ff"  # Default marker color
         self.date_column = None
         self.map_window = None
-        self.filtered_df = None  # Store filtered DataFrame
+        self.filtered_rows = None  # Positions in the loaded data that passed the last filter
+        self.shown_rows = None  # Positions in df of the points on the loaded map page
+        self.map_settings = None  # Options the loaded map page was built with
+        self.filter_params = None  # Bounds and date range of the last filter
+        self.map_cache = open_map_cache()
+        self.jobs = JobRunner()  # File loading, filtering/map building and KMZ export run here
         self.current_map_type = 'OpenStreetMap'  # Initialize map type
         self.initUI()
 
@@ -103,6 +205,11 @@ class CoordPlotter(QWidget):
         layout.addWidget(QLabel('Columna para etiquetas:'))
         layout.addWidget(self.label_column)
 
+        self.popup_columns_list = QListWidget()
+        self.popup_columns_list.setMaximumHeight(100)
+        layout.addWidget(QLabel('Columnas en popups y KMZ:'))
+        layout.addWidget(self.popup_columns_list)
+
         self.filter_btn = QPushButton('Aplicar filtro')
         self.filter_btn.clicked.connect(self.apply_filter)
         layout.addWidget(self.filter_btn)
@@ -119,9 +226,16 @@ class CoordPlotter(QWidget):
         color_layout.addWidget(self.random_color_cb)
         layout.addLayout(color_layout)
 
+        kmz_layout = QHBoxLayout()
         self.download_kmz_btn = QPushButton('Descargar KMZ')
         self.download_kmz_btn.clicked.connect(self.download_kmz)
-        layout.addWidget(self.download_kmz_btn)
+        kmz_layout.addWidget(self.download_kmz_btn)
+        self.kmz_filtered_cb = QCheckBox('Exportar solo los puntos filtrados')
+        kmz_layout.addWidget(self.kmz_filtered_cb)
+        layout.addLayout(kmz_layout)
+
+        self.progress_bar = QProgressBar()
+        layout.addWidget(self.progress_bar)
 
         self.status_label = QLabel('Esperando archivo...')
         layout.addWidget(self.status_label)
@@ -135,149 +249,144 @@ class CoordPlotter(QWidget):
             self.process_file(file_path)
 
     def process_file(self, file_path):
-        try:
-            if file_path.endswith('.xlsx'):
-                self.df = pd.read_excel(file_path)
-            else:
-                self.df = pd.read_csv(file_path)
-
-            self.lat_col = self.find_column(self.df, ['latitud', 'lat', 'latitude'])
-            self.lon_col = self.find_column(self.df, ['longitud', 'lon', 'long', 'longitude'])
-
-            if self.lat_col is None or self.lon_col is None:
-                self.status_label.setText('No se encontraron columnas de latitud y longitud.')
-                return
-
-            self.df[self.lat_col] = self.df[self.lat_col].apply(self.clean_coordinate)
-            self.df[self.lon_col] = self.df[self.lon_col].apply(self.clean_coordinate)
-
-            self.label_column.clear()
-            self.label_column.addItems(self.df.columns)
-
-            self.date_column_combo.clear()
-            self.date_column_combo.addItem('Ninguna')
-            date_columns = self.find_date_columns(self.df)
-            self.date_column_combo.addItems(date_columns)
-
-        except Exception as e:
-            self.status_label.setText(f'Error al procesar el archivo: {str(e)}')
+        # Reading and preparing large files takes a while: do it in the background
+        self.jobs.cancel('filter')
+        self.upload_btn.setEnabled(False)
+        self.filter_btn.setEnabled(False)
+        self.progress_bar.setValue(0)
+        self.status_label.setText('Cargando archivo...')
+        self.jobs.submit('load', lambda job: self.load_engine(job, file_path), self.file_loaded, self.load_failed,
+                         self.progress_bar.setValue, self.show_preview)
+
+    def load_engine(self, job, file_path):
+        # Runs in the job thread: no widget access here
+        return GeoEngine(self.map_cache).load(file_path, job.signals.progress.emit, job.signals.preview.emit)
+
+    def show_preview(self, preview):
+        self.status_label.setText(f'Cargando archivo... columnas: {", ".join(map(str, preview.columns))}')
+        self.label_column.clear()
+        self.label_column.addItems([str(col) for col in preview.columns])
+
+    def load_failed(self, message):
+        self.upload_btn.setEnabled(True)
+        self.filter_btn.setEnabled(True)
+        self.status_label.setText(f'Error al procesar el archivo: {message}')
+
+    def file_loaded(self, job, engine):
+        self.upload_btn.setEnabled(True)
+        self.filter_btn.setEnabled(True)
+        self.engine = engine
+        self.filtered_rows = None
+        self.shown_rows = None
+        self.map_settings = None
+
+        status = engine.describe_problems() or f'Archivo cargado: {len(engine.df):,} filas.'
+        self.status_label.setText(f'{status} {describe_latency(job)}')
+
+        self.label_column.clear()
+        self.label_column.addItems([str(col) for col in engine.df.columns])
+
+        self.popup_columns_list.clear()
+        for col in engine.df.columns:
+            item = QListWidgetItem(str(col))
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked)
+            self.popup_columns_list.addItem(item)
+
+        self.date_column_combo.clear()
+        self.date_column_combo.addItem('Ninguna')
+        self.date_column_combo.addItems(list(engine.date_values))
 
     def update_map_type(self, map_type):
-            self.current_map_type = map_type
-            if self.filtered_df is not None:
-                self.create_map(self.filtered_df)
+        # The loaded page already has every tile layer: switch it in place instead of rebuilding the map
+        self.current_map_type = map_type
+        if self.map_window is not None:
+            self.map_window.map_view.page().runJavaScript(f'ecohSetBaseLayer({json.dumps(map_type)})')
     
-    def find_date_columns(self, df):
-        date_columns = []
-        for col in df.columns:
-            try:
-                pd.to_datetime(df[col])
-                date_columns.append(col)
-            except:
-                pass
-        return date_columns
-
     def update_date_filter(self, column):
-        if column != 'Ninguna':
+        if self.engine is not None and column in self.engine.date_values:
             self.date_column = column
-            min_date = pd.to_datetime(self.df[column].min())
-            max_date = pd.to_datetime(self.df[column].max())
+            min_date = self.engine.date_values[column].min()
+            max_date = self.engine.date_values[column].max()
             self.min_date.setDateTime(min_date.to_pydatetime())
             self.max_date.setDateTime(max_date.to_pydatetime())
         else:
             self.date_column = None
 
     def apply_filter(self):
-        if self.df is None:
+        if self.engine is None:
             return
 
-        self.filtered_df = self.df[
-            (self.df[self.lat_col] >= self.min_lat.value()) &
-            (self.df[self.lat_col] <= self.max_lat.value()) &
-            (self.df[self.lon_col] >= self.min_lon.value()) &
-            (self.df[self.lon_col] <= self.max_lon.value())
-        ]
-
+        # Read every widget here; the job itself only sees this snapshot
+        bounds = (self.min_lat.value(), self.max_lat.value(), self.min_lon.value(), self.max_lon.value())
+        date_range = None
         if self.date_column:
-            min_date = self.min_date.dateTime().toPyDateTime()
-            max_date = self.max_date.dateTime().toPyDateTime()
-            self.filtered_df = self.filtered_df[
-                (pd.to_datetime(self.filtered_df[self.date_column]) >= min_date) &
-                (pd.to_datetime(self.filtered_df[self.date_column]) <= max_date)
-            ]
-
-        self.create_map(self.filtered_df)
-
-    def create_map(self, df):
-        # Define tile layers for different map types
-        tile_layers = {
-            'OpenStreetMap': folium.TileLayer(
-                tiles='OpenStreetMap',
-                name='OpenStreetMap'
-            ),
-            'Satelital': folium.TileLayer(
-                tiles='https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
-                attr='Esri',
-                name='Satelital'
-            ),
-            'Híbrido': folium.TileLayer(
-                tiles='https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}',
-                attr='Google',
-                name='Híbrido'
-            )
+            date_range = (self.min_date.dateTime().toPyDateTime(), self.max_date.dateTime().toPyDateTime())
+        settings = self.engine.map_settings(self.selected_columns(), self.use_clustering_cb.isChecked(),
+                                            self.marker_color, self.random_color_cb.isChecked())
+        # Push only the difference to the loaded page when it was built with the same options;
+        # otherwise build and load a new page
+        window = self.map_window
+        live = (window is not None and window.isVisible() and window.bridge.is_ready
+                and self.shown_rows is not None and settings == self.map_settings)
+        params = {
+            'filter_params': (bounds, self.date_column, date_range),
+            'settings': settings,
+            'map_type': self.current_map_type,
+            'previous': self.shown_rows if live else None,
         }
-
-        # Create base map
-        m = folium.Map(
-            location=[df[self.lat_col].mean(), df[self.lon_col].mean()],
-            zoom_start=10,
-            tiles=None  # Don't set any tiles initially
-        )
-
-        # Add all tile layers to the map
-        for layer in tile_layers.values():
-            layer.add_to(m)
-
-        # Set the selected tile layer as active
-        tile_layers[self.current_map_type].add_to(m)
-
-        if self.use_clustering_cb.isChecked():
-            marker_cluster = MarkerCluster().add_to(m)
+        self.status_label.setText('Filtrando...')
+        engine = self.engine
+        self.jobs.submit('filter', lambda job: self.filter_rows(job, engine, params), self.show_rows,
+                         self.filter_failed)
+
+    def filter_rows(self, job, engine, params):
+        # Runs in the job thread. A newer filter cancels this one; stop before building the map.
+        rows, params['filter_time'] = engine.filter(*params['filter_params'])
+        params['rows'] = rows
+        if job.cancelled:
+            return params
+
+        if params['previous'] is not None:
+            params['payload'] = engine.live_update(rows, params['previous'], params['settings'])
         else:
-            marker_cluster = m
-
-        label_col = self.label_column.currentText()
-
-        for idx, row in df.iterrows():
-            popup_content = f"{label_col}: {row[label_col]}<br>"
-            for col in df.columns:
-                if col != label_col:
-                    popup_content += f"{col}: {row[col]}<br>"
-            
-            if self.random_color_cb.isChecked():
-                color = f"#{random.randint(0, 0xFFFFFF):06x}"
-            else:
-                color = self.marker_color
-
-            folium.Marker(
-                [row[self.lat_col], row[self.lon_col]],
-                popup=folium.Popup(popup_content, max_width=300),
-                icon=folium.Icon(color=color, icon="info-sign")
-            ).add_to(marker_cluster)
-
-        # Add layer control
-        folium.LayerControl().add_to(m)
-
-        temp_map_path = os.path.join(os.path.dirname(__file__), "temp_map.html")
-        m.save(temp_map_path)
-
+            params['map_path'], params['hit'] = engine.map_page(rows, params['filter_params'],
+                                                                params['settings'], params['map_type'])
+        return params
+
+    def filter_failed(self, message):
+        self.status_label.setText(f'Error al filtrar: {message}')
+
+    def show_rows(self, job, result):
+        rows = result['rows']
+        self.filtered_rows = rows
+        self.filter_params = result['filter_params']
+        if 'payload' in result:
+            if not self.map_window.isVisible():
+                # The window was closed while filtering: build a full page instead
+                self.shown_rows = None
+                self.apply_filter()
+                return
+            self.map_window.bridge.update.emit(result['payload'])
+            message = 'Mapa actualizado.'
+        else:
+            self.show_map(result['map_path'])
+            self.map_settings = result['settings']
+            cache = 'Mapa cargado de la caché' if result['hit'] else 'Mapa generado con éxito'
+            message = f'{cache} ({describe_cache(self.map_cache)}).'
+        self.shown_rows = rows
+        self.status_label.setText(f'{message} {result["filter_time"]}. {describe_latency(job)}')
+
+    def show_map(self, map_path):
         if self.map_window is None or not self.map_window.isVisible():
             self.map_window = MapWindow(self)
-        self.map_window.map_view.setUrl(QUrl.fromLocalFile(temp_map_path))
+            self.map_window.map_type_combo.blockSignals(True)
+            self.map_window.map_type_combo.setCurrentText(self.current_map_type)
+            self.map_window.map_type_combo.blockSignals(False)
+        self.map_window.bridge.is_ready = False
+        self.map_window.map_view.setUrl(QUrl.fromLocalFile(map_path))
         self.map_window.show()
-
-        self.status_label.setText('Mapa generado con éxito.')
-        self.map = m
+        self.map = map_path
 
     def select_color(self):
         color = QColorDialog.getColor()
@@ -286,44 +395,44 @@ class CoordPlotter(QWidget):
             self.color_btn.setStyleSheet(f"background-color: {self.marker_color};")
 
     def download_kmz(self):
-        if self.df is None or self.map is None:
+        if self.engine is None or self.map is None:
             self.status_label.setText('No hay datos para exportar.')
             return
 
         file_path, _ = QFileDialog.getSaveFileName(self, "Guardar archivo KMZ", "", "KMZ Files (*.kmz)")
         if file_path:
-            try:
-                kml = simplekml.Kml()
-                label_col = self.label_column.currentText()
-
-                for idx, row in self.df.iterrows():
-                    point = kml.newpoint(name=str(row[label_col]))
-                    point.coords = [(row[self.lon_col], row[self.lat_col])]
-                    description = ""
-                    for col in self.df.columns:
-                        if col != label_col:
-                            description += f"{col}: {row[col]}\n"
-                    point.description = description
-
-                kml.save(file_path)
-                self.status_label.setText('Archivo KMZ guardado con éxito.')
-            except Exception as e:
-                self.status_label.setText(f'Error al guardar el archivo KMZ: {str(e)}')
-
-    def find_column(self, df, possible_names):
-        lower_columns = {col.lower(): col for col in df.columns}
-        for name in possible_names:
-            if name.lower() in lower_columns:
-                return lower_columns[name.lower()]
-        raise ValueError(f'No se encontró ninguna columna que coincida con: {possible_names}')
-
-    def clean_coordinate(self, coord):
-        if isinstance(coord, str):
-            coord = coord.replace("'", "").replace(",", ".")
-        return -abs(float(coord))
+            rows = self.filtered_rows if self.kmz_filtered_cb.isChecked() else None
+            label_col = self.label_column.currentText()
+            columns = self.selected_columns()
+            engine = self.engine
+            self.progress_bar.setValue(0)
+            self.status_label.setText('Exportando KMZ...')
+            self.jobs.submit(
+                'kmz', lambda job: engine.export_kmz(file_path, label_col, columns, rows, job.signals.progress.emit),
+                self.kmz_saved, self.kmz_failed, self.progress_bar.setValue)
+
+    def kmz_saved(self, job, rows):
+        self.status_label.setText(f'Archivo KMZ guardado con éxito ({rows:,} puntos). {describe_latency(job)}')
+
+    def kmz_failed(self, message):
+        self.status_label.setText(f'Error al guardar el archivo KMZ: {message}')
+
+    def selected_columns(self):
+        # Columnas marcadas en la lista, con la de etiqueta primero
+        selected = [col for i, col in enumerate(self.engine.df.columns)
+                    if self.popup_columns_list.item(i).checkState() == Qt.Checked]
+        return self.engine.columns(self.label_column.currentText(), selected)
+
+def open_window():
+    # Opens the tool inside an already running Qt application (e.g. the main menu)
+    window = CoordPlotter()
+    window.show()
+    return window
+
+def main():
+    app = QApplication(sys.argv)
+    window = open_window()
+    sys.exit(app.exec_())
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    ex = CoordPlotter()
-    ex.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -1,22 +1,19 @@
 import flet as ft
 import pandas as pd
-import folium
-from folium.plugins import MarkerCluster
-import simplekml
-import random
-import tempfile
 import webbrowser
-import os
+
+from geo_engine import GeoEngine
+from geo_map import describe_cache, open_map_cache
 
 class CoordPlotter:
     def __init__(self, page: ft.Page):
         self.page = page
-        self.df = None
-        self.lat_col = None
-        self.lon_col = None
+        self.engine = None  # GeoEngine del archivo cargado: datos, índices y armado del mapa
         self.map = None
         self.marker_color = "#3388ff"
         self.date_column = None
+        self.filtered_rows = None  # Posiciones de las filas que pasaron el último filtro
+        self.map_cache = open_map_cache()
 
         self.page.title = "ECOH TOOLS, Geoposicionador de Coordenadas Ver 1.0 By Rafo"
         self.page.vertical_alignment = ft.MainAxisAlignment.START
@@ -24,6 +21,7 @@ class CoordPlotter:
 
         self.upload_btn = ft.ElevatedButton("Subir archivo", on_click=self.upload_file)
         self.status_text = ft.Text("Esperando archivo...")
+        self.progress_bar = ft.ProgressBar(value=0, width=400)
         
         self.min_lat = ft.TextField(label="Lat min", value="-90", width=100)
         self.max_lat = ft.TextField(label="Lat max", value="90", width=100)
@@ -43,21 +41,27 @@ class CoordPlotter:
             options=[],
             width=200,
         )
+        # Una casilla por columna del archivo para elegir qué va en popups y KMZ
+        self.popup_columns_row = ft.Row(wrap=True)
 
         self.filter_btn = ft.ElevatedButton("Aplicar filtro", on_click=self.apply_filter)
         self.use_clustering_cb = ft.Checkbox(label="Usar agrupación de marcadores", value=True)
         self.random_color_cb = ft.Checkbox(label="Usar colores aleatorios")
 
         self.download_kmz_btn = ft.ElevatedButton("Descargar KMZ", on_click=self.download_kmz)
+        self.kmz_filtered_cb = ft.Checkbox(label="Exportar solo los puntos filtrados")
 
         self.page.add(
             self.upload_btn,
             ft.Row([self.min_lat, self.max_lat, self.min_lon, self.max_lon]),
             ft.Row([self.date_column_dropdown, self.min_date, self.max_date]),
             self.label_column_dropdown,
+            ft.Text("Columnas en popups y KMZ:"),
+            self.popup_columns_row,
             self.filter_btn,
             ft.Row([self.use_clustering_cb, self.random_color_cb]),
-            self.download_kmz_btn,
+            ft.Row([self.download_kmz_btn, self.kmz_filtered_cb]),
+            self.progress_bar,
             self.status_text,
         )
 
@@ -72,104 +76,67 @@ class CoordPlotter:
         self.page.update()
         file_picker.pick_files(allowed_extensions=["xlsx", "csv"])
 
-    def process_file(self, file_path):
-        try:
-            if file_path.endswith('.xlsx'):
-                self.df = pd.read_excel(file_path)
-            else:
-                self.df = pd.read_csv(file_path)
-
-            self.lat_col = self.find_column(self.df, ['latitud', 'lat', 'latitude'])
-            self.lon_col = self.find_column(self.df, ['longitud', 'lon', 'long', 'longitude'])
+    def show_progress(self, percent):
+        self.progress_bar.value = percent / 100
+        self.page.update()
 
-            if self.lat_col is None or self.lon_col is None:
-                self.status_text.value = 'No se encontraron columnas de latitud y longitud.'
-                self.page.update()
-                return
+    def show_preview(self, preview):
+        # El primer bloque llega enseguida: mostramos las columnas mientras se lee el resto
+        self.status_text.value = f'Cargando archivo... columnas: {", ".join(map(str, preview.columns))}'
+        self.page.update()
 
-            self.df[self.lat_col] = self.df[self.lat_col].apply(self.clean_coordinate)
-            self.df[self.lon_col] = self.df[self.lon_col].apply(self.clean_coordinate)
+    def process_file(self, file_path):
+        try:
+            self.status_text.value = 'Cargando archivo...'
+            self.show_progress(0)
+            self.engine = GeoEngine(self.map_cache).load(file_path, self.show_progress, self.show_preview)
+            self.filtered_rows = None
+            columns = self.engine.df.columns
 
-            self.label_column_dropdown.options = [ft.dropdown.Option(col) for col in self.df.columns]
-            
-            date_columns = self.find_date_columns(self.df)
-            self.date_column_dropdown.options = [ft.dropdown.Option("Ninguna")] + [ft.dropdown.Option(col) for col in date_columns]
+            self.label_column_dropdown.options = [ft.dropdown.Option(col) for col in columns]
+            self.popup_columns_row.controls = [ft.Checkbox(label=str(col), value=True, data=col)
+                                               for col in columns]
+            self.date_column_dropdown.options = [ft.dropdown.Option("Ninguna")] + [ft.dropdown.Option(col) for col in self.engine.date_values]
 
             self.status_text.value = 'Archivo procesado con éxito.'
+            if self.engine.problems:
+                self.status_text.value += ' ' + self.engine.describe_problems()
             self.page.update()
 
         except Exception as e:
             self.status_text.value = f'Error al procesar el archivo: {str(e)}'
             self.page.update()
 
-    def find_date_columns(self, df):
-        date_columns = []
-        for col in df.columns:
-            try:
-                pd.to_datetime(df[col])
-                date_columns.append(col)
-            except:
-                pass
-        return date_columns
-
     def apply_filter(self, e):
-        if self.df is None:
+        if self.engine is None:
             return
 
-        filtered_df = self.df[
-            (self.df[self.lat_col] >= float(self.min_lat.value)) &
-            (self.df[self.lat_col] <= float(self.max_lat.value)) &
-            (self.df[self.lon_col] >= float(self.min_lon.value)) &
-            (self.df[self.lon_col] <= float(self.max_lon.value))
-        ]
-
-        if self.date_column_dropdown.value != "Ninguna":
-            min_date = pd.to_datetime(self.min_date.value)
-            max_date = pd.to_datetime(self.max_date.value)
-            filtered_df = filtered_df[
-                (pd.to_datetime(filtered_df[self.date_column_dropdown.value]) >= min_date) &
-                (pd.to_datetime(filtered_df[self.date_column_dropdown.value]) <= max_date)
-            ]
-
-        self.create_map(filtered_df)
-
-    def create_map(self, df):
-        m = folium.Map(location=[df[self.lat_col].mean(), df[self.lon_col].mean()], zoom_start=10)
-        
-        if self.use_clustering_cb.value:
-            marker_cluster = MarkerCluster().add_to(m)
-        else:
-            marker_cluster = m
-
-        label_col = self.label_column_dropdown.value
-
-        for idx, row in df.iterrows():
-            popup_content = f"{label_col}: {row[label_col]}<br>"
-            for col in df.columns:
-                if col != label_col:
-                    popup_content += f"{col}: {row[col]}<br>"
-            
-            if self.random_color_cb.value:
-                color = f"#{random.randint(0, 0xFFFFFF):06x}"
-            else:
-                color = self.marker_color
-
-            folium.Marker(
-                [row[self.lat_col], row[self.lon_col]],
-                popup=folium.Popup(popup_content, max_width=300),
-                icon=folium.Icon(color=color, icon="info-sign")
-            ).add_to(marker_cluster)
-
-        temp_map_file = tempfile.NamedTemporaryFile(delete=False, suffix='.html')
-        m.save(temp_map_file.name)
-        webbrowser.open('file://' + temp_map_file.name, new=2)
-
-        self.status_text.value = 'Mapa generado con éxito.'
+        bounds = (float(self.min_lat.value), float(self.max_lat.value),
+                  float(self.min_lon.value), float(self.max_lon.value))
+        date_column = self.date_column_dropdown.value
+        date_range = None
+        if date_column in self.engine.date_values:
+            date_range = (pd.to_datetime(self.min_date.value), pd.to_datetime(self.max_date.value))
+        filter_params = (bounds, date_column, date_range)
+        self.filtered_rows, filter_time = self.engine.filter(*filter_params)
+
+        self.create_map(self.filtered_rows, filter_params)
+        self.status_text.value += f' {filter_time}.'
+        self.page.update()
+
+    def create_map(self, rows, filter_params):
+        settings = self.engine.map_settings(self.selected_columns(), self.use_clustering_cb.value,
+                                            self.marker_color, self.random_color_cb.value)
+        map_path, hit = self.engine.map_page(rows, filter_params, settings)
+        webbrowser.open('file://' + map_path, new=2)
+
+        message = 'Mapa cargado de la caché' if hit else 'Mapa generado con éxito'
+        self.status_text.value = f'{message} ({describe_cache(self.map_cache)}).'
         self.page.update()
-        self.map = m
+        self.map = map_path
 
     def download_kmz(self, e):
-        if self.df is None or self.map is None:
+        if self.engine is None or self.map is None:
             self.status_text.value = 'No hay datos para exportar.'
             self.page.update()
             return
@@ -177,20 +144,10 @@ class CoordPlotter:
         def save_file_result(e: ft.FilePickerResultEvent):
             if e.path:
                 try:
-                    kml = simplekml.Kml()
-                    label_col = self.label_column_dropdown.value
-
-                    for idx, row in self.df.iterrows():
-                        point = kml.newpoint(name=str(row[label_col]))
-                        point.coords = [(row[self.lon_col], row[self.lat_col])]
-                        description = ""
-                        for col in self.df.columns:
-                            if col != label_col:
-                                description += f"{col}: {row[col]}\n"
-                        point.description = description
-
-                    kml.save(e.path)
-                    self.status_text.value = 'Archivo KMZ guardado con éxito.'
+                    rows = self.filtered_rows if self.kmz_filtered_cb.value else None
+                    rows = self.engine.export_kmz(e.path, self.label_column_dropdown.value,
+                                                  self.selected_columns(), rows)
+                    self.status_text.value = f'Archivo KMZ guardado con éxito ({rows:,} puntos).'
                 except Exception as ex:
                     self.status_text.value = f'Error al guardar el archivo KMZ: {str(ex)}'
                 self.page.update()
@@ -200,17 +157,10 @@ class CoordPlotter:
         self.page.update()
         save_file_dialog.save_file(file_name="mapa.kmz", allowed_extensions=["kmz"])
 
-    def find_column(self, df, possible_names):
-        lower_columns = {col.lower(): col for col in df.columns}
-        for name in possible_names:
-            if name.lower() in lower_columns:
-                return lower_columns[name.lower()]
-        return None
-
-    def clean_coordinate(self, coord):
-        if isinstance(coord, str):
-            coord = coord.replace("'", "").replace(",", ".")
-        return -abs(float(coord))
+    def selected_columns(self):
+        # Columnas marcadas, con la de etiqueta primero
+        selected = [cb.data for cb in self.popup_columns_row.controls if cb.value]
+        return self.engine.columns(self.label_column_dropdown.value, selected)
 
 def main(page: ft.Page):
     CoordPlotter(page)
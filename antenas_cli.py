@@ -0,0 +1,149 @@
+"""Agregación de archivos de tráfico de antenas sin interfaz gráfica.
+
+Procesa varios CSV (rutas o patrones glob) en paralelo y deja un resultado
+por archivo en el directorio de salida. No importa Qt ni matplotlib.
+
+Uso:
+    python antenas_cli.py "datos/*.csv" -o resultados
+    python antenas_cli.py a.csv b.csv -o resultados --format parquet --incremental
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from antenas_core import SKETCH_EPSILON, aggregate_file, sketch_capacity_for
+
+
+def expand_inputs(patterns):
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            print(f"Sin coincidencias para {pattern}", file=sys.stderr)
+        paths.extend(matches)
+    # Sin duplicados y conservando el orden
+    return list(dict.fromkeys(os.path.abspath(path) for path in paths))
+
+
+def output_names(paths):
+    names = {}
+    used = set()
+    for path in paths:
+        base = os.path.splitext(os.path.basename(path))[0]
+        name, n = base, 2
+        while name in used:
+            name, n = f'{base}-{n}', n + 1
+        used.add(name)
+        names[path] = name
+    return names
+
+
+def results_to_frames(results):
+    return {
+        'movil_counts': pd.DataFrame(
+            list(results['movil_counts'].items()), columns=['movil', 'cantidad']),
+        'coord_counts': pd.DataFrame(
+            [(lat, lon, count) for (lat, lon), count in results['coord_counts'].items()],
+            columns=['latitud', 'longitud', 'cantidad']),
+        'compania_counts': pd.DataFrame(
+            list(results['compania_counts'].items()), columns=['compania_origen', 'cantidad']),
+        'trafico_por_tecnologia': pd.DataFrame(
+            list(results['trafico_por_tecnologia'].items()), columns=['tecnologia', 'cantidad_trafico']),
+    }
+
+
+def _json_default(value):
+    # Escalares de numpy que quedan en los conteos
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def write_results(results, output_dir, name, fmt):
+    frames = results_to_frames(results)
+    if fmt == 'json':
+        path = os.path.join(output_dir, f'{name}.json')
+        payload = {key: frame.to_dict(orient='records') for key, frame in frames.items()}
+        payload['stats'] = results['stats']
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, default=_json_default)
+        return path
+
+    path = os.path.join(output_dir, name)
+    os.makedirs(path, exist_ok=True)
+    for key, frame in frames.items():
+        # Las claves 'N/A' conviven con números: se guardan como texto para tener un tipo por columna
+        for col in frame.columns[:-1]:
+            if frame[col].dtype == object:
+                frame[col] = frame[col].astype(str)
+        frame.to_parquet(os.path.join(path, f'{key}.parquet'), index=False)
+    with open(os.path.join(path, 'stats.json'), 'w', encoding='utf-8') as f:
+        json.dump(results['stats'], f, default=_json_default)
+    return path
+
+
+def process_file(path, output_dir, name, fmt, processes, sketch_capacity, use_cache, incremental):
+    start = time.perf_counter()
+    results = aggregate_file(path, processes, sketch_capacity=sketch_capacity,
+                             use_cache=use_cache, incremental=incremental)
+    if 'error' in results['stats']:
+        # Resultado incompleto: no se escribe nada y el archivo cuenta como fallido
+        raise RuntimeError(results['stats']['error'])
+    output = write_results(results, output_dir, name, fmt)
+    return output, results['stats'], time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='+', help='archivos CSV o patrones glob')
+    parser.add_argument('-o', '--output-dir', default='.', help='directorio para los resultados')
+    parser.add_argument('--format', choices=['json', 'parquet'], default='json')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='archivos procesados a la vez')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='procesos por archivo (para archivos muy grandes)')
+    parser.add_argument('--approximate', action='store_true',
+                        help='top de móviles y coordenadas con memoria acotada')
+    parser.add_argument('--epsilon', type=float, default=SKETCH_EPSILON,
+                        help='error relativo máximo del modo aproximado')
+    parser.add_argument('--incremental', action='store_true',
+                        help='procesar solo lo agregado desde la última ejecución')
+    parser.add_argument('--no-cache', action='store_true', help='no usar la caché columnar')
+    args = parser.parse_args(argv)
+
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        parser.error('no hay archivos para procesar')
+    os.makedirs(args.output_dir, exist_ok=True)
+    names = output_names(paths)
+    sketch_capacity = sketch_capacity_for(args.epsilon) if args.approximate else None
+    options = (args.format, args.processes, sketch_capacity, not args.no_cache, args.incremental)
+
+    failures = 0
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(args.jobs, len(paths)), mp_context=context) as pool:
+        futures = {
+            pool.submit(process_file, path, args.output_dir, names[path], *options): path
+            for path in paths
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                output, stats, elapsed = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"[{done}/{len(paths)}] {path}: error: {e}", file=sys.stderr)
+                continue
+            print(f"[{done}/{len(paths)}] {path}: {stats['rows']:,} filas en {elapsed:.1f} s -> {output}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
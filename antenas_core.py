@@ -0,0 +1,811 @@
+import codecs
+import glob
+import hashlib
+import io
+import math
+import multiprocessing
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from packaging import version
+
+from disk_cache import FINGERPRINT_SAMPLE, DiskCache, default_cache_dir, file_fingerprint
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Sin pyarrow se trabaja siempre desde el CSV
+    pa = pq = None
+
+CHUNKSIZE = 100000
+
+# Bajo este tamaño no compensa levantar procesos
+PARALLEL_MIN_BYTES = 64 * 1024 * 1024
+# Rangos por proceso, para repartir mejor la carga y reportar progreso más seguido
+RANGES_PER_PROCESS = 4
+
+# Columnas que usa la agregación; son las únicas que se leen del CSV y se guardan en la caché
+USED_COLUMNS = ['movil', 'latitud', 'longitud', 'compania_origen', 'tecnologia', 'cantidad_trafico']
+# Esquema de lectura. movil y las coordenadas se leen como texto y se convierten por bloque
+# (compact_chunk): un valor que no es número no obliga a releer el archivo sin tipos
+CSV_DTYPES = {
+    'movil': 'str',
+    'latitud': 'str',
+    'longitud': 'str',
+    'compania_origen': 'category',
+    'tecnologia': 'category',
+}
+# Coordenadas en millonésimas de grado (Int32): exactas hasta 6 decimales y la mitad de memoria que float64
+COORD_SCALE = 10 ** 6
+COORD_DTYPE = 'Int32'
+# Valores absolutos mayores no son grados; se cuentan como texto igual que "S/I"
+COORD_MAX_DEGREES = 360
+# Cambiar al modificar el formato de la caché para invalidar las entradas anteriores
+CACHE_VERSION = 3
+CACHE_MAX_BYTES = int(os.environ.get('ECOH_CACHE_MAX_BYTES', 4 * 1024 ** 3))
+# Bytes que se comparan para verificar que el archivo solo creció desde el último punto de control
+CHECKPOINT_SAMPLE = 64 * 1024
+# Bloques repartidos a lo largo del archivo que se prueban al detectar la codificación
+ENCODING_BLOCKS = 8
+ENCODING_BLOCK_SIZE = 64 * 1024
+# Orden fijo de prueba; latin-1 acepta cualquier byte y cierra la lista
+ENCODING_CANDIDATES = ('utf-8', 'cp1252', 'latin-1')
+# Manejador de errores de decodificación del parser: los bytes que no valen en la codificación
+# detectada (filas Latin-1 sueltas en un export UTF-8, fuera de los bloques muestreados)
+# se leen como cp1252, o latin-1 si cp1252 no los define, en vez de cortar la lectura
+ENCODING_ERRORS = 'ecoh-cp1252'
+
+RESULT_KEYS = ('movil_counts', 'coord_counts', 'compania_counts', 'trafico_por_tecnologia')
+# Conteos que pueden tener decenas de millones de claves; son los que se aproximan en modo acotado
+SKETCH_KEYS = ('movil_counts', 'coord_counts')
+# Error relativo por defecto del modo aproximado (~10.000 entradas por conteo)
+SKETCH_EPSILON = 1e-4
+
+# Valor usado cuando falta la columna o la celda viene vacía
+MISSING = 'N/A'
+
+
+def _decode_cp1252(error):
+    chars = []
+    for byte in error.object[error.start:error.end]:
+        try:
+            chars.append(bytes([byte]).decode('cp1252'))
+        except UnicodeDecodeError:
+            chars.append(chr(byte))
+    return ''.join(chars), error.end
+
+
+codecs.register_error(ENCODING_ERRORS, _decode_cp1252)
+
+
+def encode_coordinate(series):
+    # Grados a millonésimas (Int32), aceptando coma decimal como clean_coordinates. Si
+    # queda texto que no es coordenada (p. ej. "S/I") devuelve object y ese texto cuenta
+    # como valor propio, como se contaba antes del esquema tipado
+    if str(series.dtype) == COORD_DTYPE:
+        return series
+    try:
+        # Conversión directa, mucho más rápida que to_numeric cuando todo el bloque es número
+        numeric = series.astype('float64')
+    except (ValueError, TypeError):
+        numeric = pd.to_numeric(series, errors='coerce').astype('float64')
+    invalid = series.notna() & ~(numeric.abs() <= COORD_MAX_DEGREES)
+    if invalid.any() and not pd.api.types.is_numeric_dtype(series):
+        text = series[invalid].astype(str).str.strip().str.replace(',', '.', regex=False)
+        numeric[invalid] = pd.to_numeric(text, errors='coerce')
+        invalid = series.notna() & ~(numeric.abs() <= COORD_MAX_DEGREES)
+    values = (numeric.where(~invalid) * COORD_SCALE).round().astype(COORD_DTYPE)
+    if not invalid.any():
+        return values
+    values = values.astype(object)
+    values[invalid] = series[invalid].astype(str).str.strip()
+    return values
+
+
+def _decode_coordinate(value):
+    return value if isinstance(value, str) else value / COORD_SCALE
+
+
+def _normalize_movil(series):
+    # La columna se lee como texto; si todo son enteros queda Int64 y si no, object con
+    # los números como entero, para que un móvil cuente igual en todos los bloques
+    if pd.api.types.is_integer_dtype(series):
+        return series
+    try:
+        return series.astype('Int64')
+    except (ValueError, TypeError):
+        pass
+    numeric = pd.to_numeric(series, errors='coerce')
+    integral = numeric.notna() & (numeric % 1 == 0)
+    if (integral | series.isna()).all():
+        return numeric.astype('Int64')
+    values = series.to_numpy(dtype=object, copy=True)
+    values[integral.to_numpy()] = numeric[integral].astype('int64').to_numpy().astype(object)
+    return pd.Series(values, index=series.index, dtype=object)
+
+
+def compact_chunk(chunk):
+    # Si un bloque trae texto que no es número en estas columnas se deja como texto (así
+    # se puede guardar en Parquet); aggregate_chunk lo convierte al contar
+    for col in ('latitud', 'longitud'):
+        if col in chunk.columns:
+            encoded = encode_coordinate(chunk[col])
+            if str(encoded.dtype) == COORD_DTYPE:
+                chunk[col] = encoded
+    if 'movil' in chunk.columns:
+        movil = _normalize_movil(chunk['movil'])
+        if pd.api.types.is_numeric_dtype(movil):
+            chunk['movil'] = movil
+    return chunk
+
+
+def _counts(series):
+    counts = series.value_counts(sort=False)
+    # Las columnas category reportan también las categorías sin filas
+    counts = counts[counts > 0]
+    missing = int(series.isna().sum())
+    if missing:
+        counts = pd.concat([counts, pd.Series([missing], index=[MISSING])])
+    return counts
+
+
+def aggregate_chunk(chunk):
+    # Conteos parciales de un bloque, calculados por columna en vez de fila a fila
+    n = len(chunk)
+    columns = chunk.columns
+
+    if 'movil' in columns:
+        movil_counts = _counts(_normalize_movil(chunk['movil']))
+    else:
+        movil_counts = pd.Series([n], index=[MISSING])
+
+    if 'latitud' in columns and 'longitud' in columns:
+        coords = pd.DataFrame({
+            'latitud': encode_coordinate(chunk['latitud']),
+            'longitud': encode_coordinate(chunk['longitud']),
+        })
+        coord_counts = coords.groupby(['latitud', 'longitud'], sort=False).size()
+        missing = int(coords.isna().any(axis=1).sum())
+        if missing:
+            coord_counts = pd.concat([
+                coord_counts,
+                pd.Series([missing], index=pd.MultiIndex.from_tuples([(MISSING, MISSING)]))
+            ])
+    else:
+        coord_counts = pd.Series([n], index=pd.MultiIndex.from_tuples([(MISSING, MISSING)]))
+
+    if 'compania_origen' in columns:
+        compania_counts = _counts(chunk['compania_origen'])
+    else:
+        compania_counts = pd.Series([n], index=[MISSING])
+
+    if 'cantidad_trafico' in columns:
+        trafico = pd.to_numeric(chunk['cantidad_trafico'], errors='coerce').fillna(0)
+    else:
+        trafico = pd.Series(0, index=chunk.index)
+    if 'tecnologia' in columns:
+        tecnologia = chunk['tecnologia']
+        trafico_por_tecnologia = trafico.groupby(tecnologia, sort=False, observed=True).sum()
+        missing = tecnologia.isna()
+        if missing.any():
+            trafico_por_tecnologia = pd.concat([
+                trafico_por_tecnologia,
+                pd.Series([trafico[missing].sum()], index=[MISSING])
+            ])
+    else:
+        trafico_por_tecnologia = pd.Series([trafico.sum()], index=[MISSING])
+
+    return {
+        'movil_counts': movil_counts,
+        'coord_counts': coord_counts,
+        'compania_counts': compania_counts,
+        'trafico_por_tecnologia': trafico_por_tecnologia,
+    }
+
+
+def _combine(partials):
+    if len(partials) == 1:
+        return partials[0]
+    combined = pd.concat(partials)
+    levels = list(range(combined.index.nlevels))
+    return combined.groupby(level=levels, sort=False).sum()
+
+
+def sketch_capacity_for(epsilon):
+    # Entradas necesarias para que el error de cada conteo no supere epsilon * filas
+    return max(int(math.ceil(1 / epsilon)) - 1, 1)
+
+
+def _prune(counts, capacity):
+    # Paso de Misra-Gries: se resta a todos el conteo (capacity + 1)-ésimo y se
+    # descartan los que quedan en cero. Devuelve el resumen y lo restado.
+    if len(counts) <= capacity:
+        return counts, 0
+    threshold = int(counts.nlargest(capacity + 1).iloc[-1])
+    counts = counts - threshold
+    return counts[counts > 0], threshold
+
+
+class Aggregator:
+    # Cada cuántos parciales se compactan en uno solo para acotar la memoria
+    COMPACT_EVERY = 16
+
+    def __init__(self, sketch_capacity=None):
+        self.rows = 0
+        self.bytes_read = 0
+        # Pasa a False si algún bloque no se pudo guardar en la caché
+        self.cacheable = True
+        self._partials = {key: [] for key in RESULT_KEYS}
+        # Con sketch_capacity, movil_counts y coord_counts guardan como máximo esa cantidad
+        # de claves (resumen Misra-Gries). Los conteos quedan por debajo del real en a lo
+        # más sketch_error[key], que nunca supera filas / (sketch_capacity + 1).
+        self.sketch_capacity = sketch_capacity
+        self.sketch_error = {key: 0 for key in SKETCH_KEYS}
+
+    def update(self, chunk):
+        self._add(aggregate_chunk(chunk))
+        self.rows += len(chunk)
+
+    def merge(self, other):
+        self._add({key: _combine(parts) for key, parts in other._partials.items() if parts})
+        self.rows += other.rows
+        self.bytes_read += other.bytes_read
+        self.cacheable = self.cacheable and other.cacheable
+        for key in SKETCH_KEYS:
+            self.sketch_error[key] += other.sketch_error[key]
+
+    def _add(self, partial):
+        for key, series in partial.items():
+            parts = self._partials[key]
+            parts.append(series)
+            if self.sketch_capacity and key in SKETCH_KEYS:
+                summary, error = _prune(_combine(parts), self.sketch_capacity)
+                self._partials[key] = [summary]
+                self.sketch_error[key] += error
+            elif len(parts) >= self.COMPACT_EVERY:
+                self._partials[key] = [_combine(parts)]
+
+    def compact(self):
+        for key, parts in self._partials.items():
+            if len(parts) > 1:
+                self._partials[key] = [_combine(parts)]
+
+    def results(self):
+        results = {}
+        for key in RESULT_KEYS:
+            parts = self._partials[key]
+            results[key] = _combine(parts).to_dict() if parts else {}
+        results['coord_counts'] = {
+            (_decode_coordinate(lat), _decode_coordinate(lon)): count
+            for (lat, lon), count in results['coord_counts'].items()
+        }
+        return results
+
+
+def read_csv_chunks(source, encoding, names=None):
+    kwargs = {
+        'chunksize': CHUNKSIZE,
+        'encoding': encoding,
+        'usecols': lambda col: col in USED_COLUMNS,
+        'dtype': CSV_DTYPES,
+    }
+    if names is not None:
+        kwargs.update(names=names, header=None)
+    # Comprobamos la versión de pandas para usar el parámetro correcto
+    if version.parse(pd.__version__) >= version.parse('1.3.0'):
+        kwargs['on_bad_lines'] = 'skip'
+        kwargs['encoding_errors'] = ENCODING_ERRORS
+    else:
+        kwargs['error_bad_lines'] = False
+    for chunk in pd.read_csv(source, **kwargs):
+        yield compact_chunk(chunk)
+
+
+class _RangeFile(io.RawIOBase):
+    # Vista de solo lectura sobre los bytes [start, end) de un archivo
+
+    def __init__(self, path, start, end):
+        super().__init__()
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        n = self._file.readinto(memoryview(buffer)[:size])
+        self._remaining -= n
+        self.bytes_read += n
+        return n
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def read_header(path, encoding):
+    # Devuelve los nombres de columna y el offset donde empiezan los datos
+    with open(path, 'rb') as f:
+        line = f.readline()
+        data_start = f.tell()
+    names = pd.read_csv(io.StringIO(line.decode(encoding, errors='replace')), nrows=0).columns
+    return list(names), data_start
+
+
+def split_ranges(path, start, end, parts):
+    # Corta [start, end) en rangos que terminan justo después de un salto de línea.
+    # Supone que no hay saltos de línea dentro de campos entre comillas.
+    bounds = [start]
+    with open(path, 'rb') as f:
+        for i in range(1, parts):
+            f.seek(start + (end - start) * i // parts)
+            f.readline()
+            bound = min(f.tell(), end)
+            if bound > bounds[-1]:
+                bounds.append(bound)
+    if end > bounds[-1]:
+        bounds.append(end)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+class _PartWriter:
+    # Guarda los bloques parseados como Parquet; si cambia el esquema abre un archivo nuevo
+
+    def __init__(self, directory, prefix):
+        self.directory = directory
+        self.prefix = prefix
+        self.ok = True
+        self._writer = None
+        self._count = 0
+
+    def write(self, chunk):
+        if not self.ok:
+            return
+        columns = [col for col in USED_COLUMNS if col in chunk.columns]
+        try:
+            table = pa.Table.from_pandas(chunk[columns], preserve_index=False)
+            if self._writer is not None and not table.schema.equals(self._writer.schema):
+                self._close_writer()
+            if self._writer is None:
+                os.makedirs(self.directory, exist_ok=True)
+                path = os.path.join(self.directory, f'{self.prefix}-{self._count:04d}.parquet')
+                self._writer = pq.ParquetWriter(path, table.schema)
+                self._count += 1
+            self._writer.write_table(table)
+        except (pa.ArrowException, ValueError, TypeError) as e:
+            print(f"No se pudo guardar el bloque en la caché: {e}")
+            self.ok = False
+
+    def discard(self):
+        self.close()
+        for path in glob.glob(os.path.join(self.directory, f'{self.prefix}-*.parquet')):
+            os.remove(path)
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def close(self):
+        self._close_writer()
+
+
+def _aggregate_source(open_source, encoding, names=None, cache_part=None, progress=None, size=0,
+                      sketch_capacity=None):
+    aggregator = Aggregator(sketch_capacity)
+    writer = _PartWriter(*cache_part) if cache_part is not None else None
+    with open_source() as source:
+        try:
+            for chunk in read_csv_chunks(source, encoding, names=names):
+                aggregator.update(chunk)
+                if writer is not None:
+                    writer.write(chunk)
+                if progress is not None and size:
+                    progress(int(source.bytes_read / size * 100))
+        except Exception:
+            if writer is not None:
+                writer.discard()
+            raise
+        finally:
+            if writer is not None:
+                writer.close()
+            aggregator.bytes_read = source.bytes_read
+    aggregator.cacheable = writer is None or writer.ok
+    return aggregator
+
+
+def aggregate_range(path, start, end, names, encoding, cache_dir=None, sketch_capacity=None, progress=None):
+    cache_part = (cache_dir, f'part-{start:016d}') if cache_dir is not None else None
+    aggregator = _aggregate_source(lambda: _RangeFile(path, start, end), encoding, names=names,
+                                   cache_part=cache_part, progress=progress, size=end - start,
+                                   sketch_capacity=sketch_capacity)
+    aggregator.compact()
+    return aggregator
+
+
+def aggregate_sequential(path, encoding, progress=None, cache_dir=None, sketch_capacity=None, end=None):
+    # Una sola pasada: el progreso sale de los bytes que el parser ya consumió
+    size = os.path.getsize(path) if end is None else end
+    cache_part = (cache_dir, f'part-{0:016d}') if cache_dir is not None else None
+    return _aggregate_source(lambda: _RangeFile(path, 0, size), encoding, cache_part=cache_part,
+                             progress=progress, size=size, sketch_capacity=sketch_capacity)
+
+
+def _run_pool(processes, tasks, progress=None, sketch_capacity=None):
+    # tasks: lista de (función, argumentos, peso para el progreso)
+    total = max(sum(weight for _, _, weight in tasks), 1)
+    done = 0
+    aggregator = Aggregator(sketch_capacity)
+    # 'spawn' evita hacer fork de un proceso con hilos de Qt activos
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+        futures = {pool.submit(func, *args): weight for func, args, weight in tasks}
+        for future in as_completed(futures):
+            aggregator.merge(future.result())
+            done += futures[future]
+            if progress is not None:
+                progress(int(done / total * 100))
+    return aggregator
+
+
+def _aggregate_ranges(path, start, end, names, encoding, processes, progress=None, cache_dir=None,
+                      sketch_capacity=None):
+    ranges = split_ranges(path, start, end, processes * RANGES_PER_PROCESS)
+    tasks = [(aggregate_range, (path, lo, hi, names, encoding, cache_dir, sketch_capacity), hi - lo)
+             for lo, hi in ranges]
+    return _run_pool(processes, tasks, progress, sketch_capacity)
+
+
+def aggregate_parallel(path, encoding, processes, progress=None, cache_dir=None, sketch_capacity=None, end=None):
+    names, data_start = read_header(path, encoding)
+    end = os.path.getsize(path) if end is None else end
+    aggregator = _aggregate_ranges(path, data_start, end, names, encoding, processes, progress,
+                                   cache_dir, sketch_capacity)
+    aggregator.bytes_read += data_start
+    return aggregator
+
+
+def open_cache():
+    # Sin pyarrow o sin un directorio escribible se trabaja sin caché
+    if pq is None:
+        return None
+    try:
+        return DiskCache(default_cache_dir('antenas'), CACHE_MAX_BYTES)
+    except OSError as e:
+        print(f"Caché desactivada: {e}")
+        return None
+
+
+def cache_key(path):
+    return file_fingerprint(path, CACHE_VERSION)
+
+
+def aggregate_cached_part(part_path, sketch_capacity=None):
+    aggregator = Aggregator(sketch_capacity)
+    parquet = pq.ParquetFile(part_path)
+    columns = [col for col in USED_COLUMNS if col in parquet.schema_arrow.names]
+    for batch in parquet.iter_batches(batch_size=CHUNKSIZE, columns=columns):
+        aggregator.update(batch.to_pandas())
+    aggregator.compact()
+    return aggregator
+
+
+def aggregate_cached(entry, processes=1, progress=None, sketch_capacity=None):
+    # Agrega desde una entrada de la caché leyendo solo las columnas necesarias
+    parts = sorted(glob.glob(os.path.join(entry, '*.parquet')))
+    if processes > 1 and len(parts) > 1:
+        tasks = [(aggregate_cached_part, (part, sketch_capacity), os.path.getsize(part)) for part in parts]
+        return _run_pool(processes, tasks, progress, sketch_capacity)
+
+    aggregator = Aggregator(sketch_capacity)
+    for i, part in enumerate(parts, 1):
+        aggregator.merge(aggregate_cached_part(part, sketch_capacity))
+        if progress is not None:
+            progress(int(i / len(parts) * 100))
+    return aggregator
+
+
+_encoding_cache = {}
+
+
+def _sample_blocks(path, size):
+    if size <= ENCODING_BLOCKS * ENCODING_BLOCK_SIZE:
+        # Archivo chico: se prueba completo
+        with open(path, 'rb') as f:
+            return [f.read()]
+    offsets = sorted({min(size * i // ENCODING_BLOCKS, size - ENCODING_BLOCK_SIZE)
+                      for i in range(ENCODING_BLOCKS)})
+    blocks = []
+    with open(path, 'rb') as f:
+        for offset in offsets:
+            f.seek(offset)
+            block = f.read(ENCODING_BLOCK_SIZE)
+            # Un bloque puede empezar a mitad de un carácter UTF-8 multibyte
+            skip = 0
+            while offset and skip < 3 and skip < len(block) and 0x80 <= block[skip] < 0xC0:
+                skip += 1
+            blocks.append(block[skip:])
+    return blocks
+
+
+def _decodes(blocks, encoding):
+    for block in blocks:
+        decoder = codecs.getincrementaldecoder(encoding)('strict')
+        try:
+            # final=False tolera un carácter cortado al final del bloque
+            decoder.decode(block, final=False)
+        except UnicodeDecodeError:
+            return False
+    return True
+
+
+def detect_encoding(path):
+    # Prueba decodificar en estricto bloques muestreados de todo el archivo, en orden fijo.
+    # El resultado se recuerda por archivo (ruta, tamaño y mtime).
+    start = time.perf_counter()
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key in _encoding_cache:
+        return {'encoding': _encoding_cache[key], 'seconds': time.perf_counter() - start,
+                'bytes_read': 0, 'cached': True}
+
+    blocks = _sample_blocks(path, stat.st_size)
+    encoding = ENCODING_CANDIDATES[-1]
+    for candidate in ENCODING_CANDIDATES:
+        if _decodes(blocks, candidate):
+            encoding = candidate
+            break
+    if encoding == 'utf-8' and blocks and blocks[0].startswith(codecs.BOM_UTF8):
+        encoding = 'utf-8-sig'
+    _encoding_cache[key] = encoding
+    return {'encoding': encoding, 'seconds': time.perf_counter() - start,
+            'bytes_read': sum(len(block) for block in blocks), 'cached': False}
+
+
+def last_line_end(path, size):
+    # Offset justo después del último salto de línea; lo que sigue puede ser una fila a medio escribir
+    with open(path, 'rb') as f:
+        pos = size
+        while pos > 0:
+            start = max(pos - CHECKPOINT_SAMPLE, 0)
+            f.seek(start)
+            block = f.read(pos - start)
+            i = block.rfind(b'\n')
+            if i >= 0:
+                return start + i + 1
+            pos = start
+    return 0
+
+
+def _prefix_hash(path, offset):
+    # Hash del inicio del archivo y del bloque que termina en offset
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        digest.update(f.read(min(offset, CHECKPOINT_SAMPLE)))
+        f.seek(max(offset - CHECKPOINT_SAMPLE, 0))
+        digest.update(f.read(min(offset, CHECKPOINT_SAMPLE)))
+    return digest.hexdigest()
+
+
+def open_checkpoints():
+    # Sin un directorio escribible no hay puntos de control y se procesa el archivo completo
+    try:
+        return DiskCache(default_cache_dir('checkpoints'), CACHE_MAX_BYTES)
+    except OSError as e:
+        print(f"Puntos de control desactivados: {e}")
+        return None
+
+
+def _checkpoint_key(path, sketch_capacity):
+    material = repr((os.path.abspath(path), sketch_capacity, CACHE_VERSION))
+    return hashlib.sha1(material.encode('utf-8')).hexdigest()
+
+
+def load_checkpoint(store, path, sketch_capacity=None):
+    # Devuelve el punto de control si el archivo conserva intacto lo ya procesado
+    entry = None
+    try:
+        entry = store.get(_checkpoint_key(path, sketch_capacity))
+        if entry is None:
+            return None
+        with open(entry, 'rb') as f:
+            checkpoint = pickle.load(f)
+        offset = checkpoint['offset']
+        if os.path.getsize(path) < offset or _prefix_hash(path, offset) != checkpoint['prefix_hash']:
+            return None
+        aggregator = checkpoint['aggregator']
+        if not isinstance(aggregator, Aggregator):
+            raise TypeError(f"agregador de tipo {type(aggregator).__name__}")
+        # Guardado antes de un cambio de atributos de Aggregator
+        missing = set(vars(Aggregator(aggregator.sketch_capacity))) - set(vars(aggregator))
+        if missing:
+            raise AttributeError(f"faltan atributos del agregador: {', '.join(sorted(missing))}")
+        return checkpoint
+    except Exception as e:
+        # Guardado con otra versión de pandas o de Aggregator, o dañado: se descarta
+        print(f"Punto de control ilegible, se procesará el archivo completo: {e}")
+        if entry is not None:
+            store.discard(entry)
+        return None
+
+
+def save_checkpoint(store, path, aggregator, offset, names, encoding):
+    # Devuelve si quedó guardado; un error al escribir no afecta al resultado ya calculado
+    aggregator.compact()
+    key = _checkpoint_key(path, aggregator.sketch_capacity)
+    tmp_path = store.reserve(key)
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({
+                'offset': offset,
+                'prefix_hash': _prefix_hash(path, offset),
+                'names': names,
+                'encoding': encoding,
+                'aggregator': aggregator,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        store.commit(key, tmp_path)
+        return True
+    except OSError as e:
+        print(f"No se pudo guardar el punto de control: {e}")
+        return False
+    finally:
+        store.discard(tmp_path)
+
+
+def _aggregate_span(path, start, end, names, encoding, processes, progress=None, sketch_capacity=None):
+    if processes > 1 and end - start >= PARALLEL_MIN_BYTES:
+        return _aggregate_ranges(path, start, end, names, encoding, processes, progress,
+                                 sketch_capacity=sketch_capacity)
+    return aggregate_range(path, start, end, names, encoding, sketch_capacity=sketch_capacity, progress=progress)
+
+
+def _aggregate_tail(path, start, end, names, encoding, cache_dir=None, sketch_capacity=None):
+    # Última línea sin salto de línea: puede ser una fila completa o una que se está escribiendo
+    if end <= start:
+        return None
+    try:
+        return aggregate_range(path, start, end, names, encoding, cache_dir, sketch_capacity)
+    except Exception as e:
+        print(f"Se omitió la última línea incompleta: {e}")
+        return None
+
+
+def aggregate_file(path, processes=1, progress=None, sketch_capacity=None, use_cache=True, incremental=False):
+    # Agrega un archivo de tráfico de antenas y devuelve los conteos más 'stats'.
+    # Con incremental=True guarda el estado y el offset procesado, y en la siguiente
+    # carga solo procesa las filas agregadas al final del archivo.
+    file_size = os.path.getsize(path)
+    extra_bytes = 0
+    aggregator = Aggregator(sketch_capacity)
+    tail = None
+    cache_status = 'off'
+    checkpoint_status = 'off'
+    encoding_info = None
+    error = None  # Falla que dejó el resultado incompleto; se informa en stats['error']
+
+    checkpoints = open_checkpoints() if incremental else None
+    checkpoint = load_checkpoint(checkpoints, path, sketch_capacity) if checkpoints is not None else None
+    data_end = last_line_end(path, file_size) if incremental else file_size
+
+    if checkpoint is not None:
+        checkpoint_status = 'resumed'
+        extra_bytes += 2 * min(checkpoint['offset'], CHECKPOINT_SAMPLE)
+        aggregator = checkpoint['aggregator']
+        aggregator.bytes_read = 0
+        names, encoding = checkpoint['names'], checkpoint['encoding']
+        try:
+            if data_end > checkpoint['offset']:
+                aggregator.merge(_aggregate_span(path, checkpoint['offset'], data_end, names, encoding,
+                                                 processes, progress, sketch_capacity))
+                save_checkpoint(checkpoints, path, aggregator, data_end, names, encoding)
+        except Exception as e:
+            print(f"Error al procesar el archivo: {e}")
+            error = str(e)
+        tail = _aggregate_tail(path, data_end, file_size, names, encoding, sketch_capacity=sketch_capacity)
+    else:
+        cache = open_cache() if use_cache else None
+        entry = None
+        if cache is not None:
+            key = cache_key(path)
+            extra_bytes += min(file_size, 3 * FINGERPRINT_SAMPLE)
+            try:
+                entry = cache.get(key)
+                cache_status = 'hit' if entry else 'miss'
+            except OSError as e:
+                print(f"Caché desactivada: {e}")
+                cache = None
+
+        if entry:
+            # El archivo ya está en la caché columnar: no hace falta detectar la codificación ni parsear el CSV
+            try:
+                aggregator = aggregate_cached(entry, processes, progress, sketch_capacity=sketch_capacity)
+                if incremental and data_end == file_size:
+                    encoding_info = detect_encoding(path)
+                    encoding = encoding_info['encoding']
+                    extra_bytes += encoding_info['bytes_read']
+                    names, _ = read_header(path, encoding)
+                    if checkpoints is not None and save_checkpoint(checkpoints, path, aggregator, data_end,
+                                                                   names, encoding):
+                        checkpoint_status = 'saved'
+            except Exception as e:
+                print(f"Error al leer la caché: {e}")
+                error = str(e)
+        else:
+            try:
+                encoding_info = detect_encoding(path)
+                encoding = encoding_info['encoding']
+                extra_bytes += encoding_info['bytes_read']
+            except Exception as e:
+                print(f"Error al detectar codificación: {e}")
+                encoding = 'ISO-8859-1'  # Usar como fallback
+
+            cache_dir = cache.reserve(key) if cache is not None else None
+            try:
+                # El progreso se calcula con los bytes consumidos por el parser, sin recorrer antes el archivo
+                if processes > 1 and file_size >= PARALLEL_MIN_BYTES:
+                    aggregator = aggregate_parallel(path, encoding, processes, progress, cache_dir=cache_dir,
+                                                    sketch_capacity=sketch_capacity, end=data_end)
+                else:
+                    aggregator = aggregate_sequential(path, encoding, progress, cache_dir=cache_dir,
+                                                      sketch_capacity=sketch_capacity, end=data_end)
+                if incremental:
+                    names, _ = read_header(path, encoding)
+                    if checkpoints is not None and save_checkpoint(checkpoints, path, aggregator, data_end,
+                                                                   names, encoding):
+                        checkpoint_status = 'saved'
+                    tail = _aggregate_tail(path, data_end, file_size, names, encoding, cache_dir, sketch_capacity)
+                if cache_dir is not None and aggregator.cacheable and (tail is None or tail.cacheable):
+                    try:
+                        cache.commit(key, cache_dir)
+                    except OSError as e:
+                        # El resultado ya está calculado; solo no queda guardado para la próxima vez
+                        print(f"No se pudo guardar en la caché: {e}")
+            except Exception as e:
+                print(f"Error al procesar el archivo: {e}")
+                error = str(e)
+            finally:
+                if cache_dir is not None:
+                    cache.discard(cache_dir)
+
+    if tail is not None:
+        # La última fila sin salto de línea se cuenta, pero no entra en el punto de control
+        aggregator.merge(tail)
+    if progress is not None:
+        progress(100)
+
+    results = aggregator.results()
+    results['stats'] = ingest_stats(aggregator, file_size, extra_bytes, cache_status)
+    results['stats']['checkpoint'] = checkpoint_status
+    if encoding_info is not None:
+        results['stats']['encoding'] = encoding_info
+    if error is not None:
+        results['stats']['error'] = error
+    return results
+
+
+def ingest_stats(aggregator, file_size, extra_bytes=0, cache='off'):
+    # 'passes' es el número de lecturas completas del archivo; lo esperado es ~1.0
+    # (o casi 0 cuando el resultado sale de la caché)
+    bytes_read = aggregator.bytes_read + extra_bytes
+    stats = {
+        'rows': aggregator.rows,
+        'file_size': file_size,
+        'bytes_read': bytes_read,
+        'passes': bytes_read / file_size if file_size else 0.0,
+        'cache': cache,
+    }
+    if aggregator.sketch_capacity:
+        stats['sketch'] = {
+            'capacity': aggregator.sketch_capacity,
+            'error_bound': aggregator.rows / (aggregator.sketch_capacity + 1),
+            'max_error': dict(aggregator.sketch_error),
+        }
+    return stats
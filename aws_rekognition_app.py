@@ -122,11 +122,16 @@ class AWSRekognitionApp(QWidget):
             QMessageBox.critical(self, "Error", error_message)
             print(f"Error during comparison: {error_message}")  # Mensaje de depuración
 
+def open_window():
+    # Abre la herramienta dentro de una aplicación Qt que ya está corriendo (p. ej. el menú)
+    window = AWSRekognitionApp()
+    window.show()
+    return window
+
 def main():
     print("Starting application...")  # Mensaje de depuración
     app = QApplication(sys.argv)
-    ex = AWSRekognitionApp()
-    ex.show()
+    ex = open_window()
     print("Application window should be visible now.")  # Mensaje de depuración
     sys.exit(app.exec_())
 
@@ -0,0 +1,208 @@
+"""Benchmark de agregación de EcohAntenas.
+
+Uso:
+    python bench_antenas.py --rows 2000000
+    python bench_antenas.py --rows 20000000 --processes 1,2,4,8,16,32
+    python bench_antenas.py --rows 5000000 --memory
+    python bench_antenas.py --rows 5000000 --sketch-capacity 100,1000,10000
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import antenas_core
+from antenas_core import CHUNKSIZE, Aggregator, aggregate_parallel, aggregate_sequential, ingest_stats, read_csv_chunks
+
+
+def make_csv(path, rows, seed=0):
+    # Genera un archivo de tráfico sintético con la misma estructura que los de las compañías
+    rng = np.random.default_rng(seed)
+    companias = np.array(['ENTEL', 'MOVISTAR', 'CLARO', 'WOM', 'VTR'])
+    tecnologias = np.array(['2G', '3G', '4G', '5G'])
+    antenas_lat = np.round(rng.uniform(-56.0, -17.5, 5000), 6)
+    antenas_lon = np.round(rng.uniform(-76.0, -66.0, 5000), 6)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('movil,latitud,longitud,compania_origen,tecnologia,cantidad_trafico,fecha\n')
+        for start in range(0, rows, CHUNKSIZE):
+            n = min(CHUNKSIZE, rows - start)
+            # Distribución sesgada: unos pocos números concentran gran parte del tráfico
+            movil = 56900000000 + (rng.zipf(1.3, n) % 2000000)
+            antena = rng.zipf(1.2, n) % len(antenas_lat)
+            pd.DataFrame({
+                'movil': movil,
+                'latitud': antenas_lat[antena],
+                'longitud': antenas_lon[antena],
+                'compania_origen': companias[rng.integers(0, len(companias), n)],
+                'tecnologia': tecnologias[rng.integers(0, len(tecnologias), n)],
+                'cantidad_trafico': rng.integers(1, 500, n),
+                'fecha': '2024-01-01 00:00:00',
+            }).to_csv(f, header=False, index=False)
+
+
+def legacy_aggregate(path, max_rows):
+    # Implementación original de Worker.run, fila a fila con iterrows
+    movil_counts = {}
+    coord_counts = {}
+    compania_counts = {}
+    trafico_por_tecnologia = {}
+    rows = 0
+    for chunk in pd.read_csv(path, chunksize=CHUNKSIZE, nrows=max_rows):
+        for _, row in chunk.iterrows():
+            movil = row.get('movil', 'N/A')
+            coord = (row.get('latitud', 'N/A'), row.get('longitud', 'N/A'))
+            compania = row.get('compania_origen', 'N/A')
+            tecnologia = row.get('tecnologia', 'N/A')
+            trafico = row.get('cantidad_trafico', 0)
+
+            movil_counts[movil] = movil_counts.get(movil, 0) + 1
+            coord_counts[coord] = coord_counts.get(coord, 0) + 1
+            compania_counts[compania] = compania_counts.get(compania, 0) + 1
+            trafico_por_tecnologia[tecnologia] = trafico_por_tecnologia.get(tecnologia, 0) + trafico
+        rows += len(chunk)
+    return rows
+
+
+def report_passes(path, aggregator):
+    stats = ingest_stats(aggregator, os.path.getsize(path))
+    print(f'{"":<12} pasadas sobre el archivo: {stats["passes"]:.3f}')
+
+
+def vectorized_aggregate(path):
+    aggregator = aggregate_sequential(path, 'utf-8')
+    aggregator.results()
+    report_passes(path, aggregator)
+    return aggregator.rows
+
+
+def parallel_aggregate(path, processes):
+    aggregator = aggregate_parallel(path, 'utf-8', processes)
+    aggregator.results()
+    report_passes(path, aggregator)
+    return aggregator.rows
+
+
+def _memory_child(path, typed, queue):
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if typed:
+        chunks = read_csv_chunks(path, 'utf-8')
+    else:
+        # Lectura original: todas las columnas con los tipos que infiere pandas
+        chunks = pd.read_csv(path, chunksize=CHUNKSIZE)
+    aggregator = Aggregator()
+    chunk_bytes = 0
+    for chunk in chunks:
+        chunk_bytes = max(chunk_bytes, chunk.memory_usage(deep=True).sum())
+        aggregator.update(chunk)
+    aggregator.results()
+    # ru_maxrss viene en KB en Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    queue.put((aggregator.rows, int(chunk_bytes), peak, peak - base * 1024))
+
+
+def measure_memory(path):
+    context = multiprocessing.get_context('spawn')
+    for label, typed in (('original', False), ('tipado', True)):
+        queue = context.Queue()
+        process = context.Process(target=_memory_child, args=(path, typed, queue))
+        process.start()
+        rows, chunk_bytes, peak, growth = queue.get()
+        process.join()
+        # El crecimiento descuenta lo que ya ocupaban el intérprete y las librerías
+        print(f'{label:<12} {chunk_bytes / 1e6:8.1f} MB por bloque de {CHUNKSIZE:,} filas  '
+              f'pico RSS {peak / 1e6:8.1f} MB  '
+              f'crecimiento {growth / 1e6 / (rows / 1e6):.1f} MB por millón de filas')
+
+
+def compare_topk(path, capacities, k=10):
+    # Compara el top-k del modo aproximado con el exacto sobre el mismo archivo
+    exact = aggregate_sequential(path, 'utf-8').results()
+    for capacity in capacities:
+        start = time.perf_counter()
+        aggregator = aggregate_sequential(path, 'utf-8', sketch_capacity=capacity)
+        approx = aggregator.results()
+        elapsed = time.perf_counter() - start
+        bound = aggregator.rows / (capacity + 1)
+        print(f'capacidad {capacity:>8,}  {elapsed:6.2f} s  cota de error {bound:,.0f}')
+        for key in ('movil_counts', 'coord_counts'):
+            top_exact = sorted(exact[key].items(), key=lambda x: x[1], reverse=True)[:k]
+            top_approx = sorted(approx[key].items(), key=lambda x: x[1], reverse=True)[:k]
+            recall = len({x[0] for x in top_exact} & {x[0] for x in top_approx}) / len(top_exact)
+            max_error = max(exact[key][item] - count for item, count in top_approx)
+            print(f'  {key:<16} claves {len(approx[key]):>8,} / {len(exact[key]):<10,} '
+                  f'recall top-{k} {recall:.0%}  error máximo {max_error:,} '
+                  f'(restado {aggregator.sketch_error[key]:,})')
+
+
+def compare_encoding(path):
+    antenas_core._encoding_cache.clear()
+    info = antenas_core.detect_encoding(path)
+    print(f'muestreo     {info["encoding"]:<12} {info["seconds"] * 1000:8.2f} ms  {info["bytes_read"]:,} bytes')
+    try:
+        import chardet
+    except ImportError:
+        return
+    # Detección anterior: chardet sobre los primeros 10 KB
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        encoding = chardet.detect(f.read(10000))['encoding']
+    print(f'chardet      {encoding:<12} {(time.perf_counter() - start) * 1000:8.2f} ms  10,000 bytes')
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    rows = func(*args)
+    elapsed = time.perf_counter() - start
+    print(f'{label:<12} {rows:>12,} filas  {elapsed:8.2f} s  {rows / elapsed:>14,.0f} filas/s')
+    return rows / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000000, help='filas del archivo sintético')
+    parser.add_argument('--legacy-rows', type=int, default=200000,
+                        help='filas a procesar con la implementación original (es lenta)')
+    parser.add_argument('--processes', default='',
+                        help='lista de procesos para medir el modo paralelo, p. ej. 1,2,4,8')
+    parser.add_argument('--memory', action='store_true', help='medir memoria por bloque y pico de RSS')
+    parser.add_argument('--sketch-capacity', default='',
+                        help='capacidades del modo aproximado a comparar con el exacto, p. ej. 100,1000,10000')
+    parser.add_argument('--encoding', action='store_true', help='medir la detección de codificación')
+    parser.add_argument('--file', help='usar un CSV existente en vez de generar uno')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.file
+        if path is None:
+            path = os.path.join(tmp, 'antenas.csv')
+            make_csv(path, args.rows)
+        print(f'Archivo: {path} ({os.path.getsize(path) / 1e6:.1f} MB)')
+
+        before = timed('iterrows', legacy_aggregate, path, args.legacy_rows)
+        after = timed('columnar', vectorized_aggregate, path)
+        print(f'Aceleración: {after / before:.1f}x')
+
+        baseline = None
+        for processes in [int(p) for p in args.processes.split(',') if p]:
+            rate = timed(f'{processes} procesos', parallel_aggregate, path, processes)
+            baseline = baseline or rate
+            print(f'{"":<12} escalamiento {rate / baseline:.2f}x')
+
+        if args.memory:
+            measure_memory(path)
+
+        if args.encoding:
+            compare_encoding(path)
+
+        capacities = [int(c) for c in args.sketch_capacity.split(',') if c]
+        if capacities:
+            compare_topk(path, capacities)
+
+
+if __name__ == '__main__':
+    main()
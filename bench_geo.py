@@ -0,0 +1,165 @@
+"""Benchmark del mapa de EcohGeo.
+
+Compara el armado del mapa con un folium.Marker por fila contra el modo masivo
+(un solo bloque de datos) y los grupos por zoom calculados en Python: tiempo en
+Python y tamaño del HTML generado.
+
+Con --engine recorre el flujo completo de las dos interfaces llamando directo a
+GeoEngine: carga del archivo, filtros, página del mapa (sin y con caché),
+actualización en vivo y exportación KMZ.
+
+Con --kmz compara además la exportación KMZ por bloques con la anterior basada en
+simplekml: tiempo, tamaño y pico de memoria de Python (tracemalloc).
+
+Uso:
+    python bench_geo.py --rows 100000
+    python bench_geo.py --rows 1000000 --legacy-rows 20000
+    python bench_geo.py --rows 1000000 --kmz
+    python bench_geo.py --rows 1000000 --engine
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import folium
+import numpy as np
+import pandas as pd
+
+import geo_map
+from disk_cache import DiskCache
+from geo_core import popup_columns, write_kmz
+from geo_engine import GeoEngine
+
+
+def make_points(rows, seed=0):
+    # Puntos sintéticos con la misma forma que las planillas que se cargan en EcohGeo
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Numero': 56900000000 + rng.integers(0, 10 ** 8, rows),
+        'Latitud': rng.uniform(-56.0, -17.5, rows),
+        'Longitud': rng.uniform(-76.0, -66.0, rows),
+        'Fecha': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365 * 86400, rows), unit='s'),
+        'Nota': rng.choice(['hola', 'x<y & "z"', 'sin datos'], rows),
+    })
+
+
+def build_map(df, mode, cluster):
+    m = folium.Map(location=[df['Latitud'].mean(), df['Longitud'].mean()], zoom_start=10)
+    columns = popup_columns(df, 'Numero')
+    if mode == 'markers':
+        geo_map._add_markers(m, df, 'Latitud', 'Longitud', columns, cluster, '#3388ff', False)
+    elif mode == 'bulk':
+        payload = geo_map.bulk_payload(df, 'Latitud', 'Longitud', columns)
+        geo_map.BulkMarkers(payload, cluster=cluster).add_to(m)
+    else:
+        geo_map.add_points(m, df, 'Latitud', 'Longitud', columns, cluster=True)
+    return m.get_root().render()
+
+
+def timed(label, df, mode, cluster):
+    start = time.perf_counter()
+    html = build_map(df, mode, cluster)
+    elapsed = time.perf_counter() - start
+    print(f'{label:<12} {len(df):>10,} puntos  {elapsed:8.2f} s  {len(html) / 1e6:8.1f} MB HTML  '
+          f'{len(html) / len(df):8.0f} bytes/punto')
+    return elapsed / len(df)
+
+
+def legacy_kmz(path, df):
+    # Exportación original: un objeto de simplekml por fila y el documento entero en memoria
+    import simplekml
+    kml = simplekml.Kml()
+    for _, row in df.iterrows():
+        point = kml.newpoint(name=str(row['Numero']))
+        point.coords = [(row['Longitud'], row['Latitud'])]
+        description = ""
+        for col in df.columns:
+            if col != 'Numero':
+                description += f"{col}: {row[col]}\n"
+        point.description = description
+    kml.save(path)
+
+
+def streaming_kmz(path, df):
+    write_kmz(path, df, 'Latitud', 'Longitud', 'Numero', popup_columns(df, 'Numero'))
+
+
+def timed_kmz(label, func, df, directory):
+    path = os.path.join(directory, f'{label}.kmz')
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(path, df)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{label:<12} {len(df):>10,} puntos  {elapsed:8.2f} s  {os.path.getsize(path) / 1e6:8.1f} MB  '
+          f'pico {peak / 1e6:8.1f} MB  {len(df) / elapsed:>10,.0f} puntos/s')
+
+
+def step(label, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f'{label:<22} {(time.perf_counter() - start) * 1000:10.1f} ms')
+    return result
+
+
+def bench_engine(df, directory):
+    # Mismos pasos que hacen EcohGeo y EcohGeoFlet, sin interfaz de por medio
+    path = os.path.join(directory, 'puntos.csv')
+    df.to_csv(path, index=False)
+    engine = GeoEngine(DiskCache(os.path.join(directory, 'mapas'), geo_map.MAP_CACHE_MAX_BYTES))
+    step('carga', engine.load, path)
+
+    lat, lon = df['Latitud'].median(), df['Longitud'].median()
+    everything = ((-90, 90, -180, 180), None, None)
+    box = ((lat - 0.5, lat + 0.5, lon - 0.5, lon + 0.5), None, None)
+    dated = (everything[0], 'Fecha', (pd.Timestamp('2024-03-01'), pd.Timestamp('2024-03-08')))
+    rows, _ = step('filtro completo', engine.filter, *everything)
+    step('filtro caja', engine.filter, *box)
+    step('filtro fecha', engine.filter, *dated)
+
+    settings = engine.map_settings(engine.columns('Numero'))
+    step('mapa', engine.map_page, rows, everything, settings, 'OpenStreetMap')
+    step('mapa (caché)', engine.map_page, rows, everything, settings, 'OpenStreetMap')
+    box_rows, _ = engine.filter(*box)
+    step('actualización en vivo', engine.live_update, box_rows, rows, settings)
+    step('kmz', engine.export_kmz, os.path.join(directory, 'puntos.kmz'), 'Numero', list(settings[2]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='puntos para el modo masivo')
+    parser.add_argument('--legacy-rows', type=int, default=10000,
+                        help='puntos para el armado original (es lento)')
+    parser.add_argument('--no-cluster', action='store_true', help='sin agrupación de marcadores')
+    parser.add_argument('--kmz', action='store_true', help='medir la exportación KMZ')
+    parser.add_argument('--engine', action='store_true', help='medir el flujo completo con GeoEngine')
+    args = parser.parse_args()
+
+    if args.engine:
+        with tempfile.TemporaryDirectory() as tmp:
+            bench_engine(make_points(args.rows), tmp)
+        return
+
+    cluster = not args.no_cluster
+    df = make_points(max(args.rows, args.legacy_rows))
+    before = timed('por fila', df.iloc[:args.legacy_rows], 'markers', cluster)
+    after = timed('masivo', df.iloc[:args.rows], 'bulk', cluster)
+    print(f'Aceleración por punto: {before / after:.0f}x')
+    if cluster:
+        # Grupos por zoom en Python en vez de MarkerCluster en el navegador
+        timed('por zoom', df.iloc[:args.rows], 'lod', cluster)
+
+    if args.kmz:
+        with tempfile.TemporaryDirectory() as tmp:
+            try:
+                timed_kmz('simplekml', legacy_kmz, df.iloc[:args.legacy_rows], tmp)
+            except ImportError:
+                pass
+            timed_kmz('por bloques', streaming_kmz, df.iloc[:args.rows], tmp)
+
+
+if __name__ == '__main__':
+    main()
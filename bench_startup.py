@@ -0,0 +1,157 @@
+"""Benchmark del arranque del menú (main.py).
+
+Mide en procesos nuevos el tiempo hasta que la ventana del menú está lista, y con
+-X importtime los módulos que más tardan en importarse. Avisa si al arrancar se
+cargó alguna de las librerías pesadas que solo usan las herramientas.
+
+Con --tools abre además cada herramienta sola en un proceso nuevo (main.py --tool)
+y reporta su tiempo de arranque y memoria residente.
+
+Uso:
+    python bench_startup.py
+    python bench_startup.py --runs 10 --top 15 --offscreen
+    python bench_startup.py --output startup.json
+    python bench_startup.py --tools --offscreen
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Librerías que el menú no debería cargar: las importa cada herramienta al abrirse
+HEAVY_MODULES = ['pandas', 'numpy', 'matplotlib', 'folium', 'simplekml', 'chardet', 'boto3',
+                 'PyQt5.QtWebEngineWidgets']
+
+# Crea el menú como lo hace main.py y termina apenas se dibuja
+CHILD = """
+import sys
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QApplication
+import main
+QApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
+app = QApplication(sys.argv)
+window = main.MainWindow()
+window.show()
+app.processEvents()
+print(repr([name for name in {heavy!r} if name in sys.modules]))
+"""
+
+
+def run_child(env, importtime=False):
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', CHILD.format(heavy=HEAVY_MODULES)]
+    start = time.perf_counter()
+    result = subprocess.run(command, env=env, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'error')
+    loaded = ast.literal_eval(result.stdout.strip().splitlines()[-1])
+    return elapsed, loaded, result.stderr
+
+
+def parse_importtime(stderr):
+    # Líneas "import time: self [us] | cumulative | imported package"; los módulos de nivel
+    # superior no tienen sangría en el nombre
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|', 2)
+        raw_name = name.rstrip()[1:]
+        imports.append({
+            'module': raw_name.strip(),
+            'top_level': not raw_name.startswith(' '),
+            'self_us': int(self_us),
+            'cumulative_us': int(cumulative_us),
+        })
+    return imports
+
+
+def run_tool(name, env):
+    # Devuelve (segundos hasta la ventana visible, segundos de importación y armado, bytes) o el error
+    directory = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, os.path.join(directory, 'main.py'), '--tool', name, '--quit-when-ready'],
+                            env=env, capture_output=True, text=True, cwd=directory)
+    elapsed = time.perf_counter() - start
+    for line in result.stdout.splitlines():
+        if line.startswith('ecoh-ready'):
+            _, seconds, memory = line.split()
+            return elapsed, float(seconds), int(memory)
+    lines = result.stderr.strip().splitlines()
+    raise RuntimeError(lines[-1] if lines else f'código {result.returncode}')
+
+
+def bench_tools(env):
+    import main as launcher
+    results = {}
+    for name in launcher.TOOLS:
+        try:
+            elapsed, seconds, memory = run_tool(name, env)
+        except RuntimeError as e:
+            print(f'{name:<16} no abrió: {e}')
+            results[name] = {'error': str(e)}
+            continue
+        print(f'{name:<16} proceso {elapsed * 1000:8.0f} ms  importación y ventana {seconds * 1000:8.0f} ms  '
+              f'{memory / 1e6:8.0f} MB')
+        results[name] = {'process_ms': round(elapsed * 1000, 1), 'open_ms': round(seconds * 1000, 1),
+                         'memory_mb': round(memory / 1e6, 1)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='arranques a medir')
+    parser.add_argument('--top', type=int, default=10, help='módulos más lentos a listar')
+    parser.add_argument('--offscreen', action='store_true', help='usar QT_QPA_PLATFORM=offscreen (sin pantalla)')
+    parser.add_argument('--tools', action='store_true', help='medir también el arranque de cada herramienta')
+    parser.add_argument('--output', help='guardar el resultado en un JSON para comparar entre versiones')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if args.offscreen:
+        env['QT_QPA_PLATFORM'] = 'offscreen'
+
+    times = []
+    for _ in range(args.runs):
+        elapsed, loaded, _ = run_child(env)
+        times.append(elapsed)
+    print(f'menú listo     mediana {statistics.median(times) * 1000:8.0f} ms  '
+          f'mínimo {min(times) * 1000:8.0f} ms  máximo {max(times) * 1000:8.0f} ms  ({args.runs} arranques)')
+    if loaded:
+        print(f'librerías pesadas cargadas al arrancar: {", ".join(loaded)}')
+
+    _, _, stderr = run_child(env, importtime=True)
+    imports = parse_importtime(stderr)
+    total = sum(item['self_us'] for item in imports)
+    print(f'importaciones  {total / 1000:8.0f} ms en total ({len(imports)} módulos)')
+    top = sorted((item for item in imports if item['top_level']), key=lambda item: item['cumulative_us'],
+                 reverse=True)[:args.top]
+    for item in top:
+        print(f'  {item["module"]:<40} {item["cumulative_us"] / 1000:8.1f} ms')
+
+    tools = bench_tools(env) if args.tools else {}
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'tools': tools,
+                'python': sys.version.split()[0],
+                'runs_ms': [round(t * 1000, 1) for t in times],
+                'median_ms': round(statistics.median(times) * 1000, 1),
+                'heavy_loaded': loaded,
+                'imports_ms': round(total / 1000, 1),
+                'top_imports': [{'module': item['module'], 'cumulative_ms': item['cumulative_us'] / 1000}
+                                for item in top],
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import hashlib
+import os
+import shutil
+import uuid
+
+# Bytes leídos al inicio, al medio y al final del archivo para calcular su huella
+FINGERPRINT_SAMPLE = 1024 * 1024
+
+
+def default_cache_dir(name):
+    base = os.environ.get('ECOH_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'ecoh')
+    return os.path.join(base, name)
+
+
+def file_fingerprint(path, *extra):
+    # Clave a partir de ruta, tamaño, mtime y un hash del contenido muestreado.
+    # Se muestrean bloques en vez de leer todo el archivo para no agregar otra pasada.
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    digest = hashlib.sha1()
+    digest.update(repr((path, stat.st_size, stat.st_mtime_ns) + extra).encode('utf-8'))
+    with open(path, 'rb') as f:
+        for offset in sorted({0, max(stat.st_size // 2 - FINGERPRINT_SAMPLE // 2, 0),
+                              max(stat.st_size - FINGERPRINT_SAMPLE, 0)}):
+            f.seek(offset)
+            digest.update(f.read(FINGERPRINT_SAMPLE))
+    return digest.hexdigest()
+
+
+def _entry_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path)
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+class DiskCache:
+    # Caché en disco con tamaño máximo; al superarlo se borran las entradas usadas hace más tiempo.
+    # Cada entrada es un archivo o un directorio cuyo mtime marca el último uso.
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        return path
+
+    def reserve(self, key):
+        # Ruta temporal donde escribir la entrada antes de publicarla con commit
+        return self.path_for(f'{key}.tmp-{uuid.uuid4().hex}')
+
+    def commit(self, key, tmp_path):
+        path = self.path_for(key)
+        _remove(path)
+        os.replace(tmp_path, path)
+        os.utime(path)
+        self.evict()
+        return path
+
+    def discard(self, tmp_path):
+        _remove(tmp_path)
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if '.tmp-' in name:
+                continue
+            path = os.path.join(self.directory, name)
+            entries.append((os.path.getmtime(path), _entry_size(path), path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            _remove(path)
+            total -= size
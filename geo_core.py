@@ -0,0 +1,465 @@
+import os
+import warnings
+import zipfile
+
+import numpy as np
+import pandas as pd
+from packaging import version
+
+# Máximo de filas inválidas que se listan en el mensaje de estado
+MAX_REPORTED_ROWS = 10
+# Valores no vacíos por columna que se prueban antes de convertir la columna completa
+DATE_SAMPLE_ROWS = 200
+# Fracción mínima de celdas que deben ser fechas válidas para ofrecer la columna como filtro
+DATE_MIN_RATIO = 0.9
+
+# Puntos promedio por celda de la grilla espacial y máximo de celdas por eje
+GRID_POINTS_PER_CELL = 64
+GRID_MAX_CELLS = 1024
+
+# Radio en píxeles que cubre un grupo de puntos y zoom máximo de Leaflet
+CLUSTER_RADIUS_PX = 60
+CLUSTER_MAX_ZOOM = 18
+# Los puntos sueltos se muestran desde el zoom en que los grupos ya no bajan de esta fracción de los puntos
+CLUSTER_DETAIL_RATIO = 0.1
+
+# Filas que se convierten a texto de una vez al escribir un KMZ
+KMZ_CHUNK_ROWS = 50000
+
+# Filas por bloque al cargar un archivo; el primer bloque es más chico para mostrar una vista previa pronto
+LOAD_CHUNK_ROWS = 50000
+LOAD_PREVIEW_ROWS = 200
+
+# Antes de pandas 2.0 inferir el formato a partir del primer valor había que pedirlo
+if version.parse(pd.__version__) < version.parse('2.0'):
+    DATETIME_OPTIONS = {'infer_datetime_format': True}
+else:
+    DATETIME_OPTIONS = {}
+
+
+def clean_coordinates(series):
+    # Versión vectorizada de clean_coordinate: quita "'", usa "," como separador decimal
+    # y fuerza el hemisferio sur/oeste. Devuelve los valores y una máscara de celdas
+    # que no se pudieron convertir (quedan como NaN en vez de abortar la carga).
+    if pd.api.types.is_numeric_dtype(series):
+        values = series.astype('float64')
+    else:
+        text = (series.astype(str)
+                .str.replace("'", "", regex=False)
+                .str.replace(",", ".", regex=False)
+                .str.strip())
+        values = pd.to_numeric(text, errors='coerce')
+    bad = values.isna() & series.notna()
+    return -values.abs(), bad
+
+
+def describe_bad_rows(bad, column):
+    # Mensaje con las filas inválidas, numeradas como en el archivo (la fila 1 es la cabecera)
+    count = int(bad.sum())
+    if not count:
+        return None
+    rows = [str(pos + 2) for pos in bad.to_numpy().nonzero()[0][:MAX_REPORTED_ROWS]]
+    more = '…' if count > MAX_REPORTED_ROWS else ''
+    return f"{count} celdas inválidas en '{column}' (filas {', '.join(rows)}{more})"
+
+
+def _to_datetime(series):
+    with warnings.catch_warnings():
+        # Formatos que pandas no logra inferir: se parsea celda a celda sin avisar en cada carga
+        warnings.simplefilter('ignore', UserWarning)
+        parsed = pd.to_datetime(series, errors='coerce', **DATETIME_OPTIONS)
+    if not pd.api.types.is_datetime64_any_dtype(parsed):
+        # Columnas con zonas horarias mezcladas quedan como objetos
+        return None
+    if parsed.dt.tz is not None:
+        # El filtro compara con fechas sin zona horaria
+        parsed = parsed.dt.tz_localize(None)
+    return parsed
+
+
+def _looks_like_dates(series):
+    values = series.dropna()
+    if values.empty:
+        return False
+    if len(values) > DATE_SAMPLE_ROWS:
+        # Filas repartidas por todo el archivo, no solo las primeras
+        values = values.iloc[np.linspace(0, len(values) - 1, DATE_SAMPLE_ROWS).astype(int)]
+    parsed = _to_datetime(values)
+    return parsed is not None and parsed.notna().mean() >= DATE_MIN_RATIO
+
+
+def detect_date_columns(df):
+    # Devuelve {columna: Serie datetime64} solo con las columnas que parecen fechas.
+    # Primero se prueba una muestra de cada columna y solo las candidatas se convierten
+    # completas; el resultado queda guardado para que el filtro no vuelva a parsear.
+    dates = {}
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            parsed = _to_datetime(series)
+        elif pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            # Números sueltos se interpretarían como nanosegundos desde 1970
+            continue
+        elif _looks_like_dates(series):
+            parsed = _to_datetime(series)
+        else:
+            continue
+        if parsed is None or not parsed.notna().any():
+            continue
+        if parsed.notna().sum() >= DATE_MIN_RATIO * series.notna().sum():
+            dates[col] = parsed
+    return dates
+
+
+class DateIndex:
+    # Fechas de una columna ordenadas una sola vez: filtrar por rango es una búsqueda
+    # binaria y un corte, sin volver a comparar ni parsear la columna completa.
+
+    def __init__(self, dates):
+        self.dates = dates
+        # Fechas como enteros en nanosegundos, en el orden original y ordenadas
+        self.nanos = dates.to_numpy(dtype='datetime64[ns]').view('int64')
+        valid = np.flatnonzero(dates.notna().to_numpy())
+        self.order = valid[np.argsort(self.nanos[valid], kind='stable')]
+        self.keys = self.nanos[self.order]
+
+    def min(self):
+        return pd.Timestamp(self.keys[0])
+
+    def max(self):
+        return pd.Timestamp(self.keys[-1])
+
+    def span(self, start, end):
+        # Tramo de self.order con start <= fecha <= end
+        lo = np.searchsorted(self.keys, pd.Timestamp(start).value, side='left')
+        hi = np.searchsorted(self.keys, pd.Timestamp(end).value, side='right')
+        return lo, hi
+
+    def positions(self, start, end):
+        # Posiciones (no etiquetas) de las filas dentro del rango, en orden de fecha
+        lo, hi = self.span(start, end)
+        return self.order[lo:hi]
+
+    def contains(self, rows, start, end):
+        # Máscara para filas sueltas; NaT es el menor entero y queda fuera de cualquier rango
+        nanos = self.nanos[rows]
+        return (nanos >= pd.Timestamp(start).value) & (nanos <= pd.Timestamp(end).value)
+
+
+class GridIndex:
+    # Grilla regular sobre la extensión de los puntos. Las filas se ordenan por celda
+    # (fila de la grilla por latitud, luego columna por longitud), así las celdas que
+    # cubren un rectángulo son un tramo contiguo por cada fila de la grilla.
+
+    def __init__(self, lat, lon):
+        valid = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        self.cells = int(np.clip(np.sqrt(len(valid) / GRID_POINTS_PER_CELL), 1, GRID_MAX_CELLS))
+        if len(valid):
+            self.lat_min, self.lat_max = lat[valid].min(), lat[valid].max()
+            self.lon_min, self.lon_max = lon[valid].min(), lon[valid].max()
+        else:
+            self.lat_min = self.lat_max = self.lon_min = self.lon_max = 0.0
+        # Con todos los puntos en una línea el paso sería 0
+        self.lat_step = (self.lat_max - self.lat_min) / self.cells or 1.0
+        self.lon_step = (self.lon_max - self.lon_min) / self.cells or 1.0
+
+        keys = (self._cell(lat[valid], self.lat_min, self.lat_step) * self.cells
+                + self._cell(lon[valid], self.lon_min, self.lon_step))
+        order = np.argsort(keys, kind='stable')
+        self.order = valid[order]
+        # starts[k]:starts[k + 1] son las filas de la celda k dentro de self.order
+        self.starts = np.searchsorted(keys[order], np.arange(self.cells * self.cells + 1))
+
+    def _cell(self, values, origin, step):
+        return np.clip((np.asarray(values) - origin) // step, 0, self.cells - 1).astype(np.int64)
+
+    def spans(self, bounds):
+        # Tramos de self.order que pueden tener puntos dentro de bounds
+        lat_min, lat_max, lon_min, lon_max = bounds
+        if (len(self.order) == 0 or lat_min > self.lat_max or lat_max < self.lat_min
+                or lon_min > self.lon_max or lon_max < self.lon_min):
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+        rows = np.arange(self._cell(lat_min, self.lat_min, self.lat_step),
+                         self._cell(lat_max, self.lat_min, self.lat_step) + 1)
+        first = self._cell(lon_min, self.lon_min, self.lon_step)
+        last = self._cell(lon_max, self.lon_min, self.lon_step)
+        return self.starts[rows * self.cells + first], self.starts[rows * self.cells + last + 1]
+
+    def positions(self, spans):
+        starts, ends = spans
+        if len(starts) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([self.order[a:b] for a, b in zip(starts, ends)])
+
+
+def date_indexes(df):
+    return {col: DateIndex(dates) for col, dates in detect_date_columns(df).items()}
+
+
+def filter_positions(lat, lon, bounds, date_index=None, date_range=None, grid=None):
+    # Filas dentro de bounds = (lat_min, lat_max, lon_min, lon_max) y, si se indica,
+    # dentro del rango de fechas. Con índices solo se revisan las filas candidatas del
+    # índice más selectivo. Devuelve posiciones en el orden original del archivo.
+    lat_min, lat_max, lon_min, lon_max = bounds
+    # Si un índice deja más de esta cantidad de candidatas, juntarlas y ordenarlas
+    # cuesta más que recorrer todas las filas
+    scan_limit = len(lat) // 4
+
+    candidates = []
+    if date_index is not None:
+        lo, hi = date_index.span(*date_range)
+        candidates.append((hi - lo, 'date', (lo, hi)))
+    if grid is not None:
+        spans = grid.spans(bounds)
+        candidates.append(((spans[1] - spans[0]).sum(), 'grid', spans))
+    candidates = [c for c in candidates if c[0] <= scan_limit]
+
+    if not candidates:
+        rows = None
+    else:
+        _, kind, span = min(candidates, key=lambda c: c[0])
+        if kind == 'date':
+            rows = np.sort(date_index.order[span[0]:span[1]])
+        else:
+            rows = np.sort(grid.positions(span))
+        lat, lon = lat[rows], lon[rows]
+
+    inside = (lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max)
+    if date_index is not None and (rows is None or kind != 'date'):
+        inside &= date_index.contains(slice(None) if rows is None else rows, *date_range)
+    return np.flatnonzero(inside) if rows is None else rows[inside]
+
+
+def _mercator(lat, lon):
+    # Coordenadas de Web Mercator normalizadas a [0, 1], las mismas que usa Leaflet para las teselas
+    x = (lon + 180.0) / 360.0
+    sin = np.sin(np.radians(np.clip(lat, -85.0511, 85.0511)))
+    y = 0.5 - np.log((1 + sin) / (1 - sin)) / (4 * np.pi)
+    return x, y
+
+
+def cluster_levels(lat, lon):
+    # Agrupa los puntos para cada zoom, como MarkerCluster pero una sola vez en Python.
+    # Un grupo es una celda de CLUSTER_RADIUS_PX píxeles en ese zoom; como una celda del
+    # zoom z - 1 son 2x2 celdas del zoom z, cada nivel se arma a partir del anterior.
+    # Devuelve (niveles, detail_zoom): niveles[z] tiene por grupo su centro, cantidad,
+    # extensión y la posición de uno de sus puntos; desde detail_zoom se muestran los puntos.
+    positions = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+    if len(positions) == 0:
+        return [], 0
+    lat, lon = lat[positions], lon[positions]
+    x, y = _mercator(lat, lon)
+    scale = 256 * 2 ** CLUSTER_MAX_ZOOM / CLUSTER_RADIUS_PX
+    cx = np.floor(x * scale).astype(np.int64)
+    cy = np.floor(y * scale).astype(np.int64)
+
+    count = np.ones(len(lat), dtype=np.int64)
+    lat_sum, lon_sum = lat, lon
+    lat_min = lat_max = lat
+    lon_min = lon_max = lon
+    first = positions
+    levels = {}
+    for zoom in range(CLUSTER_MAX_ZOOM, -1, -1):
+        order = np.argsort((cx << 32) | cy, kind='stable')
+        keys = ((cx << 32) | cy)[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+
+        count = np.add.reduceat(count[order], starts)
+        lat_sum = np.add.reduceat(lat_sum[order], starts)
+        lon_sum = np.add.reduceat(lon_sum[order], starts)
+        lat_min = np.minimum.reduceat(lat_min[order], starts)
+        lat_max = np.maximum.reduceat(lat_max[order], starts)
+        lon_min = np.minimum.reduceat(lon_min[order], starts)
+        lon_max = np.maximum.reduceat(lon_max[order], starts)
+        first = first[order][starts]
+        levels[zoom] = {
+            'lat': lat_sum / count, 'lon': lon_sum / count, 'count': count,
+            'lat_min': lat_min, 'lat_max': lat_max, 'lon_min': lon_min, 'lon_max': lon_max,
+            'first': first,
+        }
+        cx = cx[order][starts] // 2
+        cy = cy[order][starts] // 2
+
+    detail_zoom = CLUSTER_MAX_ZOOM
+    for zoom in range(CLUSTER_MAX_ZOOM + 1):
+        if len(levels[zoom]['count']) >= CLUSTER_DETAIL_RATIO * len(positions):
+            detail_zoom = zoom
+            break
+    return [levels[zoom] for zoom in range(detail_zoom)], detail_zoom
+
+
+def describe_filter(rows, total, seconds):
+    return f'{rows:,} de {total:,} filas filtradas en {seconds * 1000:.1f} ms'
+
+
+def popup_columns(df, label_col, selected=None):
+    # Columnas de los popups y descripciones: la de etiqueta primero y luego las elegidas
+    # (todas si no se eligió ninguna lista), en el orden del archivo
+    columns = [col for col in df.columns if selected is None or col in selected]
+    if label_col in df.columns:
+        columns = [label_col] + [col for col in columns if col != label_col]
+    return columns
+
+
+def _escape_html(values):
+    for char, entity in (('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'), ('"', '&quot;')):
+        values = values.str.replace(char, entity, regex=False)
+    return values
+
+
+def _as_text(series):
+    # Mismo texto que f"{valor}"; astype(str) de pandas deja los vacíos como NaN
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biuf':
+        return pd.Series(series.to_numpy().astype(str), index=series.index, dtype=object)
+    return series.map(str)
+
+
+def describe_rows(df, columns, sep='<br>', html=False):
+    # Texto "columna: valor" de cada fila, armado columna por columna sobre la tabla
+    # completa en vez de recorrer fila por fila
+    text = pd.Series('', index=df.index, dtype=object)
+    for col in columns:
+        values = _as_text(df[col])
+        name = str(col)
+        if html:
+            values = _escape_html(values)
+            name = _escape_html(pd.Series([name])).iloc[0]
+        text = text + f'{name}: ' + values + sep
+    return text
+
+
+KML_HEADER = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+              '<kml xmlns="http://www.opengis.net/kml/2.2">\n<Document>\n')
+KML_FOOTER = '</Document>\n</kml>\n'
+
+
+def write_kmz(path, df, lat_col, lon_col, label_col, columns, rows=None, chunk_rows=KMZ_CHUNK_ROWS,
+              progress=None):
+    # Escribe un KMZ (doc.kml comprimido en un zip) por bloques de filas: cada bloque se
+    # convierte a texto columna por columna y se escribe directo al zip, así la memoria
+    # no crece con el archivo. Las filas sin coordenadas se omiten. Devuelve las escritas.
+    # Con rows (posiciones de filas) se escriben solo esas, tomando un bloque a la vez sin
+    # copiar la selección completa. progress recibe el porcentaje de filas recorridas
+    # después de cada bloque.
+    total = len(df) if rows is None else len(rows)
+    columns = [col for col in columns if col != label_col]
+    written = 0
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as kmz:
+        # force_zip64: el tamaño final no se conoce al empezar y puede pasar de 2 GB
+        with kmz.open('doc.kml', 'w', force_zip64=True) as doc:
+            doc.write(KML_HEADER.encode('utf-8'))
+            for start in range(0, total, chunk_rows):
+                chunk = df.iloc[start:start + chunk_rows] if rows is None else df.iloc[rows[start:start + chunk_rows]]
+                chunk = chunk[chunk[lat_col].notna() & chunk[lon_col].notna()]
+                if chunk.empty:
+                    continue
+                names = _escape_html(_as_text(chunk[label_col]))
+                descriptions = describe_rows(chunk, columns, sep='\n', html=True)
+                coords = _as_text(chunk[lon_col]) + ',' + _as_text(chunk[lat_col])
+                placemarks = ('<Placemark><name>' + names + '</name><description>' + descriptions
+                              + '</description><Point><coordinates>' + coords
+                              + '</coordinates></Point></Placemark>\n')
+                doc.write(''.join(placemarks).encode('utf-8'))
+                written += len(chunk)
+                if progress is not None:
+                    progress(int(min(start + chunk_rows, total) * 100 / total))
+            doc.write(KML_FOOTER.encode('utf-8'))
+    return written
+
+
+def _header_names(header):
+    # Mismos nombres que pd.read_excel: "Unnamed: i" para celdas vacías y ".n" para repetidos
+    names = []
+    seen = {}
+    for i, name in enumerate(header):
+        if name is None:
+            name = f'Unnamed: {i}'
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _excel_chunks(path, chunk_rows):
+    # openpyxl en modo solo lectura recorre la hoja sin cargarla entera; las filas se
+    # juntan en tuplas hasta completar un bloque y recién ahí se arma el DataFrame
+    import openpyxl
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        names = _header_names(next(rows, ()))
+        width = len(names)
+        # max_row sale de la dimensión guardada en el archivo y puede faltar
+        total = (sheet.max_row or 1) - 1
+        size = min(LOAD_PREVIEW_ROWS, chunk_rows)
+        batch = []
+        read = 0
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            batch.append((tuple(row) + (None,) * width)[:width])
+            if len(batch) == size:
+                read += len(batch)
+                yield pd.DataFrame.from_records(batch, columns=names), min(read / total, 1.0) if total > 0 else 0.0
+                batch = []
+                size = chunk_rows
+        yield pd.DataFrame.from_records(batch, columns=names), 1.0
+    finally:
+        workbook.close()
+
+
+def _csv_chunks(path, chunk_rows):
+    # El avance se mide con la posición en el archivo abierto en binario
+    total = max(os.path.getsize(path), 1)
+    with open(path, 'rb') as f:
+        reader = pd.read_csv(f, chunksize=chunk_rows)
+        yield reader.get_chunk(min(LOAD_PREVIEW_ROWS, chunk_rows)), min(f.tell() / total, 1.0)
+        for chunk in reader:
+            yield chunk, min(f.tell() / total, 1.0)
+
+
+def read_table_chunks(path, chunk_rows=LOAD_CHUNK_ROWS):
+    # Recorre un .xlsx o .csv por bloques: (DataFrame, fracción leída). El primer bloque
+    # es una vista previa chica y siempre se entrega, aunque el archivo no tenga filas.
+    if path.endswith('.xlsx'):
+        return _excel_chunks(path, chunk_rows)
+    return _csv_chunks(path, chunk_rows)
+
+
+def _split_columns(chunk):
+    # Copia cada columna a su propio arreglo para poder liberarlas de a una al unir los bloques
+    return {col: chunk[col].copy() for col in chunk.columns}
+
+
+def _concat_chunks(columns, chunks):
+    # Une los bloques columna por columna y suelta cada columna de los bloques apenas se
+    # une, así en el peor momento solo hay una columna duplicada y no el DataFrame completo
+    data = {}
+    for col in columns:
+        parts = [chunk.pop(col) for chunk in chunks]
+        # Un bloque con la columna vacía queda como object; se vuelve a inferir el tipo del total
+        data[col] = pd.concat(parts, ignore_index=True).infer_objects()
+        del parts
+    return pd.DataFrame(data, columns=columns, copy=False)
+
+
+def load_table(path, progress=None, preview=None, chunk_rows=LOAD_CHUNK_ROWS):
+    # Carga el archivo por bloques. progress recibe el porcentaje leído y preview el
+    # primer bloque apenas se lee, antes de terminar la carga.
+    columns = None
+    chunks = []
+    for chunk, fraction in read_table_chunks(path, chunk_rows):
+        if columns is None:
+            columns = list(chunk.columns)
+            if preview is not None:
+                preview(chunk)
+        chunks.append(_split_columns(chunk))
+        del chunk
+        if progress is not None:
+            progress(int(fraction * 100))
+    return _concat_chunks(columns, chunks)
@@ -0,0 +1,130 @@
+"""Motor de EcohGeo sin interfaz gráfica.
+
+Carga el archivo, limpia coordenadas, arma los índices, filtra, genera el mapa
+(con caché) y exporta KMZ. Lo usan EcohGeo (Qt), EcohGeoFlet (Flet) y
+bench_geo.py; no importa Qt ni Flet.
+"""
+import time
+
+import folium
+
+from disk_cache import file_fingerprint
+from geo_core import (GridIndex, clean_coordinates, date_indexes, describe_bad_rows, describe_filter,
+                      filter_positions, load_table, popup_columns, write_kmz)
+from geo_map import BaseLayerSwitcher, LiveMarkers, add_points, cached_map, live_payload, open_map_cache
+
+LAT_NAMES = ['latitud', 'lat', 'latitude']
+LON_NAMES = ['longitud', 'lon', 'long', 'longitude']
+
+# Capas base del mapa; la página generada las trae todas y muestra la elegida
+TILE_LAYERS = {
+    'OpenStreetMap': {'tiles': 'OpenStreetMap'},
+    'Satelital': {
+        'tiles': 'https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
+        'attr': 'Esri',
+    },
+    'Híbrido': {'tiles': 'https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}', 'attr': 'Google'},
+}
+
+
+def find_column(df, possible_names):
+    lower_columns = {str(col).lower(): col for col in df.columns}
+    for name in possible_names:
+        if name.lower() in lower_columns:
+            return lower_columns[name.lower()]
+    return None
+
+
+class GeoEngine:
+    # Estado de un archivo cargado. Los métodos no tocan widgets, así se pueden llamar
+    # desde un hilo de trabajo; la interfaz solo lee los resultados.
+
+    def __init__(self, map_cache=None):
+        self.df = None
+        self.lat_col = None
+        self.lon_col = None
+        self.grid = None  # Índice espacial de las coordenadas
+        self.date_values = {}  # Columnas de fecha convertidas a datetime64 y ordenadas (DateIndex)
+        self.file_key = None  # Huella del archivo, parte de la clave de la caché de mapas
+        self.problems = []  # Mensajes sobre celdas de coordenadas inválidas
+        self.map_cache = map_cache if map_cache is not None else open_map_cache()
+
+    def load(self, file_path, progress=None, preview=None):
+        df = load_table(file_path, progress, preview)
+        lat_col = find_column(df, LAT_NAMES)
+        lon_col = find_column(df, LON_NAMES)
+        if lat_col is None or lon_col is None:
+            raise ValueError('No se encontraron columnas de latitud y longitud.')
+
+        problems = []
+        for col in (lat_col, lon_col):
+            df[col], bad = clean_coordinates(df[col])
+            problems.append(describe_bad_rows(bad, col))
+
+        self.df = df
+        self.lat_col = lat_col
+        self.lon_col = lon_col
+        self.problems = [p for p in problems if p]
+        self.grid = GridIndex(df[lat_col].to_numpy(), df[lon_col].to_numpy())
+        self.date_values = date_indexes(df)
+        self.file_key = file_fingerprint(file_path)
+        return self
+
+    def describe_problems(self):
+        if not self.problems:
+            return ''
+        return '; '.join(self.problems) + '. Esas filas no se mostrarán en el mapa.'
+
+    def filter(self, bounds, date_column=None, date_range=None):
+        # Posiciones de las filas dentro de bounds (lat min, lat max, lon min, lon max) y,
+        # si hay columna de fecha, dentro de date_range. Devuelve (filas, texto con el tiempo).
+        start = time.perf_counter()
+        date_index = self.date_values.get(date_column) if date_range is not None else None
+        rows = filter_positions(self.df[self.lat_col].to_numpy(), self.df[self.lon_col].to_numpy(),
+                                bounds, date_index, date_range if date_index is not None else None, self.grid)
+        return rows, describe_filter(len(rows), len(self.df), time.perf_counter() - start)
+
+    def columns(self, label_col, selected=None):
+        return popup_columns(self.df, label_col, selected)
+
+    def map_settings(self, columns, cluster=True, color='#3388ff', random_colors=False):
+        # Opciones con que se arma la página; junto con el filtro forman la clave de la caché
+        return (self.lat_col, self.lon_col, tuple(columns), cluster, color, random_colors)
+
+    def build_map(self, rows, settings, map_type=None):
+        # Con map_type la página trae todas las capas base y los puntos se pueden actualizar
+        # por QWebChannel (LiveMarkers); sin map_type es una página normal para el navegador.
+        lat_col, lon_col, columns, cluster, color, random_colors = settings
+        df = self.df.iloc[rows]
+        location = [df[lat_col].mean(), df[lon_col].mean()]
+        if map_type is None:
+            m = folium.Map(location=location, zoom_start=10)
+            add_points(m, df, lat_col, lon_col, list(columns), cluster=cluster, color=color,
+                       random_colors=random_colors)
+            return m
+
+        m = folium.Map(location=location, zoom_start=10, tiles=None)
+        tile_layers = {name: folium.TileLayer(name=name, **options) for name, options in TILE_LAYERS.items()}
+        for layer in tile_layers.values():
+            layer.add_to(m)
+        # Solo la capa elegida queda visible; la ventana la cambia después por JS
+        BaseLayerSwitcher(tile_layers, map_type).add_to(m)
+        payload = live_payload(self.df, lat_col, lon_col, list(columns), rows, cluster=cluster)
+        LiveMarkers(payload, cluster=cluster, color=color, random_colors=random_colors).add_to(m)
+        folium.LayerControl().add_to(m)
+        return m
+
+    def map_page(self, rows, filter_params, settings, map_type=None):
+        # Mismo archivo, filtro y opciones dan la misma página: se reutiliza desde la caché.
+        # Devuelve (ruta del HTML, si vino de la caché).
+        key_parts = (self.file_key, filter_params, settings, map_type)
+        return cached_map(self.map_cache, key_parts, lambda: self.build_map(rows, settings, map_type))
+
+    def live_update(self, rows, previous, settings):
+        # Diferencia entre los puntos de una página ya cargada y las filas nuevas (JSON)
+        lat_col, lon_col, columns, cluster = settings[:4]
+        return live_payload(self.df, lat_col, lon_col, list(columns), rows, previous, cluster)
+
+    def export_kmz(self, path, label_col, columns, rows=None, progress=None):
+        # Sin rows exporta todas las filas. Devuelve la cantidad de puntos escritos.
+        return write_kmz(path, self.df, self.lat_col, self.lon_col, label_col, columns, rows, progress=progress)
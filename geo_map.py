@@ -0,0 +1,546 @@
+import hashlib
+import json
+import os
+import random
+import tempfile
+
+import folium
+import numpy as np
+from branca.element import Element, MacroElement
+from folium.elements import JSCSSMixin
+from folium.plugins import MarkerCluster
+from jinja2 import Template
+
+from disk_cache import DiskCache, default_cache_dir
+from geo_core import CLUSTER_RADIUS_PX, cluster_levels, describe_rows
+
+# Desde esta cantidad de puntos se dibujan todos desde un solo bloque de datos
+BULK_MIN_POINTS = 1000
+# Tamaño máximo de la caché de mapas generados; se cambia la versión si cambia el HTML que se arma
+MAP_CACHE_MAX_BYTES = int(os.environ.get('ECOH_MAP_CACHE_MAX_BYTES', 1024 ** 3))
+MAP_CACHE_VERSION = 3
+# Máximo de puntos sueltos dibujados a la vez en la vista con niveles de detalle; si hay
+# más, el navegador los agrupa en celdas de CLUSTER_RADIUS_PX píxeles del zoom actual
+LOD_MAX_DETAIL = 5000
+
+# Marcador y popup de un punto del bloque de datos, compartido por BulkMarkers y LodMarkers.
+# Usa las variables data, color y randomColors del script que lo incluye.
+POINT_JS = """
+            var renderer = L.canvas();
+            var entities = {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'};
+            function escape(value) {
+                return String(value === null ? 'nan' : value).replace(/[&<>"']/g, function(c) {
+                    return entities[c];
+                });
+            }
+            function rowHtml(row) {
+                var html = '';
+                for (var j = 0; j < data.columns.length; j++) {
+                    html += escape(data.columns[j]) + ': ' + escape(row[j]) + '<br>';
+                }
+                return html;
+            }
+            function popup(layer) {
+                return rowHtml(layer.options.row);
+            }
+            function pointMarker(row) {
+                var c = randomColors
+                    ? '#' + Math.floor(Math.random() * 0x1000000).toString(16).padStart(6, '0')
+                    : color;
+                return L.circleMarker([row[data.lat], row[data.lon]], {
+                    renderer: renderer, row: row, radius: 6, weight: 1,
+                    color: c, fillColor: c, fillOpacity: 0.8
+                }).bindPopup(popup, {maxWidth: 300});
+            }
+"""
+
+# Grupos por zoom y puntos sueltos de la vista, compartido por LodMarkers y LiveMarkers.
+# Usa map, data, layer, levels, detailZoom y maxDetail del script que lo incluye, más
+# eachRow(f), que recorre las filas, y rowAt(posición), que devuelve una.
+CLUSTER_JS = """
+            var clusterRadius = %d;
+            // Filas en un mismo punto (p. ej. todas las de una antena): con 6 decimales en los
+            // niveles, un grupo más chico que samePlace no se separa con más zoom
+            var samePlace = 1e-6;
+            var stackRows = 100;
+            function clusterIcon(count) {
+                var size = count < 10 ? 'small' : count < 100 ? 'medium' : 'large';
+                return L.divIcon({
+                    html: '<div><span>' + count + '</span></div>',
+                    className: 'marker-cluster marker-cluster-' + size,
+                    iconSize: L.point(40, 40)
+                });
+            }
+            function stackPopup(lat, lon) {
+                // Se buscan al abrir el popup, así los grupos no guardan sus filas
+                var html = '';
+                var count = 0;
+                eachRow(function(row) {
+                    if (row[data.lat] !== null && Math.abs(row[data.lat] - lat) <= samePlace
+                            && Math.abs(row[data.lon] - lon) <= samePlace) {
+                        if (count < stackRows) {
+                            html += (count ? '<hr>' : '') + rowHtml(row);
+                        }
+                        count++;
+                    }
+                });
+                if (count > stackRows) {
+                    html += '<hr>' + escape(count - stackRows) + ' filas más en este punto';
+                }
+                return html;
+            }
+            function stackMarker(lat, lon, count) {
+                // Un popup con las filas del punto en vez de marcadores apilados o un zoom que no las separa
+                return L.marker([lat, lon], {icon: clusterIcon(count)})
+                    .bindPopup(function() { return stackPopup(lat, lon); }, {maxWidth: 300, maxHeight: 300});
+            }
+            function clusterMarker(level, i) {
+                if (level.lat_max[i] - level.lat_min[i] <= samePlace
+                        && level.lon_max[i] - level.lon_min[i] <= samePlace) {
+                    return stackMarker(level.lat[i], level.lon[i], level.count[i]);
+                }
+                var bounds = [[level.lat_min[i], level.lon_min[i]], [level.lat_max[i], level.lon_max[i]]];
+                return L.marker([level.lat[i], level.lon[i]], {icon: clusterIcon(level.count[i])})
+                    .on('click', function() { map.fitBounds(bounds); });
+            }
+            function renderDetail(view, zoom) {
+                var inView = [];
+                var places = new Map();
+                eachRow(function(row) {
+                    if (row[data.lat] !== null && view.contains([row[data.lat], row[data.lon]])) {
+                        inView.push(row);
+                        var key = row[data.lat] + ',' + row[data.lon];
+                        places.set(key, (places.get(key) || 0) + 1);
+                    }
+                });
+                if (places.size <= maxDetail) {
+                    inView.forEach(function(row) {
+                        var key = row[data.lat] + ',' + row[data.lon];
+                        var count = places.get(key);
+                        if (count == 1) {
+                            layer.addLayer(pointMarker(row));
+                        } else if (count > 1) {
+                            layer.addLayer(stackMarker(row[data.lat], row[data.lon], count));
+                            places.set(key, 0);  // Un solo marcador por punto
+                        }
+                    });
+                    return;
+                }
+                // Demasiados puntos sueltos: se agrupan en celdas del zoom actual, con la misma
+                // forma que un nivel de cluster_levels
+                var cells = new Map();
+                var level = {lat: [], lon: [], count: [], lat_min: [], lat_max: [], lon_min: [], lon_max: [], row: []};
+                inView.forEach(function(row) {
+                    var lat = row[data.lat], lon = row[data.lon];
+                    var p = map.project([lat, lon], zoom);
+                    var key = Math.floor(p.x / clusterRadius) + ':' + Math.floor(p.y / clusterRadius);
+                    var i = cells.get(key);
+                    if (i === undefined) {
+                        cells.set(key, level.count.length);
+                        level.lat.push(lat);
+                        level.lon.push(lon);
+                        level.count.push(1);
+                        level.lat_min.push(lat);
+                        level.lat_max.push(lat);
+                        level.lon_min.push(lon);
+                        level.lon_max.push(lon);
+                        level.row.push(row);
+                        return;
+                    }
+                    level.lat[i] += lat;
+                    level.lon[i] += lon;
+                    level.count[i]++;
+                    level.lat_min[i] = Math.min(level.lat_min[i], lat);
+                    level.lat_max[i] = Math.max(level.lat_max[i], lat);
+                    level.lon_min[i] = Math.min(level.lon_min[i], lon);
+                    level.lon_max[i] = Math.max(level.lon_max[i], lon);
+                });
+                for (var i = 0; i < level.count.length; i++) {
+                    level.lat[i] /= level.count[i];
+                    level.lon[i] /= level.count[i];
+                    layer.addLayer(level.count[i] == 1 ? pointMarker(level.row[i]) : clusterMarker(level, i));
+                }
+            }
+            function render() {
+                layer.clearLayers();
+                var view = map.getBounds().pad(0.2);
+                var zoom = map.getZoom();
+                if (zoom >= detailZoom) {
+                    renderDetail(view, zoom);
+                    return;
+                }
+                var level = levels[Math.max(zoom, 0)];
+                for (var i = 0; i < level.count.length; i++) {
+                    if (view.contains([level.lat[i], level.lon[i]])) {
+                        layer.addLayer(level.count[i] == 1
+                            ? pointMarker(rowAt(level.first[i]))
+                            : clusterMarker(level, i));
+                    }
+                }
+            }
+""" % CLUSTER_RADIUS_PX
+
+
+class _RawScript(Element):
+    # Texto que va tal cual al bloque de scripts. Un Element normal compila su contenido
+    # como plantilla de Jinja, y con millones de puntos eso tarda más que armar el mapa.
+
+    def __init__(self, text):
+        super().__init__()
+        self.text = text
+
+    def render(self, **kwargs):
+        return self.text
+
+
+class _DataMarkers(JSCSSMixin, MacroElement):
+    # Base de los marcadores que se dibujan desde bloques de datos JSON. Cada bloque de
+    # self.data se publica como la variable <nombre>_<clave> fuera de la plantilla.
+
+    def __init__(self, color='#3388ff', random_colors=False):
+        super().__init__()
+        self.data = {}
+        self.color = color
+        self.random_colors = random_colors
+        self.point_js = POINT_JS
+
+    def render(self, **kwargs):
+        script = self.get_root().script
+        for key, value in self.data.items():
+            name = f'{self.get_name()}_{key}'
+            script.add_child(_RawScript(f'var {name} = {value};'), name=name)
+        super().render(**kwargs)
+
+
+class BulkMarkers(_DataMarkers):
+    # Todos los puntos en un arreglo JSON; los marcadores y sus popups se crean en el
+    # navegador. Evita un objeto JS y un bloque de HTML por fila en el archivo del mapa.
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var data = {{ this.get_name() }}_payload;
+            var color = {{ this.color|tojson }};
+            var randomColors = {{ this.random_colors|tojson }};
+            {{ this.point_js }}
+            var markers = new Array(data.rows.length);
+            for (var i = 0; i < data.rows.length; i++) {
+                markers[i] = pointMarker(data.rows[i]);
+            }
+            var layer = {{ 'L.markerClusterGroup({chunkedLoading: true})' if this.cluster else 'L.featureGroup()' }};
+            layer.addLayers ? layer.addLayers(markers) : markers.forEach(function(m) { layer.addLayer(m); });
+            layer.addTo({{ this._parent.get_name() }});
+        })();
+        {% endmacro %}
+    """)
+
+    default_js = MarkerCluster.default_js
+    default_css = MarkerCluster.default_css
+
+    def __init__(self, payload, cluster=True, color='#3388ff', random_colors=False):
+        super().__init__(color, random_colors)
+        self._name = 'BulkMarkers'
+        self.data['payload'] = payload
+        self.cluster = cluster
+
+
+class LodMarkers(_DataMarkers):
+    # Grupos calculados en Python para cada zoom (geo_core.cluster_levels). El navegador
+    # solo dibuja los grupos del zoom actual que caen en la vista y, desde detail_zoom,
+    # los puntos de la vista; solo agrupa en JavaScript si esos pasan de max_detail.
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var data = {{ this.get_name() }}_payload;
+            var levels = {{ this.get_name() }}_levels;
+            var detailZoom = {{ this.detail_zoom }};
+            var maxDetail = {{ this.max_detail }};
+            var color = {{ this.color|tojson }};
+            var randomColors = {{ this.random_colors|tojson }};
+            {{ this.point_js }}
+            var layer = L.layerGroup().addTo(map);
+            function eachRow(f) {
+                data.rows.forEach(f);
+            }
+            function rowAt(position) {
+                return data.rows[position];
+            }
+            {{ this.cluster_js }}
+            map.on('moveend', render);
+            render();
+        })();
+        {% endmacro %}
+    """)
+
+    default_css = MarkerCluster.default_css
+
+    def __init__(self, payload, levels, detail_zoom, color='#3388ff', random_colors=False,
+                 max_detail=LOD_MAX_DETAIL):
+        super().__init__(color, random_colors)
+        self._name = 'LodMarkers'
+        self.cluster_js = CLUSTER_JS
+        self.data['payload'] = payload
+        self.data['levels'] = levels_payload(levels)
+        self.detail_zoom = detail_zoom
+        self.max_detail = max_detail
+
+
+class LiveMarkers(_DataMarkers):
+    # Capa de puntos que se actualiza sin recargar la página. Empieza con el bloque de
+    # live_payload incrustado y después aplica los cambios que llegan por QWebChannel
+    # desde el objeto "ecohBridge" (señal update con otro live_payload): quita las filas
+    # de "removed", agrega las nuevas y, con agrupación, reemplaza los niveles por zoom.
+    # Cada fila se identifica por su posición en la tabla completa.
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var init = {{ this.get_name() }}_payload;
+            var data = {columns: init.columns, lat: init.lat, lon: init.lon};
+            var cluster = {{ this.cluster|tojson }};
+            var maxDetail = {{ this.max_detail }};
+            var color = {{ this.color|tojson }};
+            var randomColors = {{ this.random_colors|tojson }};
+            {{ this.point_js }}
+            var rows = new Map();
+            var markers = new Map();
+            var levels = [];
+            var detailZoom = 0;
+            var layer = L.layerGroup().addTo(map);
+            function eachRow(f) {
+                rows.forEach(f);
+            }
+            function rowAt(position) {
+                return rows.get(position);
+            }
+            // render() solo se usa con agrupación: sin ella los marcadores viven en la capa
+            // y se agregan o quitan uno a uno
+            {{ this.cluster_js }}
+            function apply(update) {
+                for (var i = 0; i < update.removed.length; i++) {
+                    var id = update.removed[i];
+                    rows.delete(id);
+                    if (markers.has(id)) {
+                        layer.removeLayer(markers.get(id));
+                        markers.delete(id);
+                    }
+                }
+                for (var i = 0; i < update.ids.length; i++) {
+                    rows.set(update.ids[i], update.rows[i]);
+                    if (!cluster) {
+                        var marker = pointMarker(update.rows[i]);
+                        markers.set(update.ids[i], marker);
+                        layer.addLayer(marker);
+                    }
+                }
+                if (cluster) {
+                    levels = update.levels;
+                    detailZoom = update.detail_zoom;
+                    render();
+                }
+                // Si ningún punto nuevo queda en la vista se centra el mapa en ellos
+                if (update.bounds && !map.getBounds().intersects(update.bounds)) {
+                    map.fitBounds(update.bounds);
+                }
+            }
+            if (cluster) {
+                map.on('moveend', render);
+            }
+            apply(init);
+            if (typeof QWebChannel !== 'undefined' && window.qt) {
+                new QWebChannel(qt.webChannelTransport, function(channel) {
+                    var bridge = channel.objects.ecohBridge;
+                    bridge.update.connect(function(text) {
+                        apply(JSON.parse(text));
+                    });
+                    bridge.ready();
+                });
+            }
+        })();
+        {% endmacro %}
+    """)
+
+    default_js = [('qwebchannel', 'qrc:///qtwebchannel/qwebchannel.js')]
+    default_css = MarkerCluster.default_css
+
+    def __init__(self, payload, cluster=True, color='#3388ff', random_colors=False,
+                 max_detail=LOD_MAX_DETAIL):
+        super().__init__(color, random_colors)
+        self._name = 'LiveMarkers'
+        self.cluster_js = CLUSTER_JS
+        self.data['payload'] = payload
+        self.cluster = cluster
+        self.max_detail = max_detail
+
+
+class BaseLayerSwitcher(MacroElement):
+    # Define ecohSetBaseLayer(nombre) en la página del mapa: deja solo esa capa base en el
+    # mapa. La ventana la llama con runJavaScript para cambiar las teselas sin regenerar
+    # el HTML. Debe agregarse después de las capas.
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        window.ecohSetBaseLayer = function(name) {
+            var map = {{ this._parent.get_name() }};
+            var layers = {
+                {%- for name, layer in this.layers.items() %}
+                {{ name|tojson }}: {{ layer.get_name() }}{{ ',' if not loop.last }}
+                {%- endfor %}
+            };
+            if (!(name in layers)) {
+                return false;
+            }
+            for (var key in layers) {
+                if (key !== name && map.hasLayer(layers[key])) {
+                    map.removeLayer(layers[key]);
+                }
+            }
+            if (!map.hasLayer(layers[name])) {
+                map.addLayer(layers[name]);
+            }
+            return true;
+        };
+        window.ecohSetBaseLayer({{ this.selected|tojson }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, layers, selected):
+        super().__init__()
+        self._name = 'BaseLayerSwitcher'
+        self.layers = layers
+        self.selected = selected
+
+
+def levels_payload(levels):
+    # Un objeto por zoom con un arreglo por campo; las coordenadas con 6 decimales (~10 cm)
+    out = []
+    for level in levels:
+        fields = []
+        for key, values in level.items():
+            if values.dtype.kind == 'f':
+                values = np.round(values, 6)
+            fields.append(f'"{key}": {json.dumps(values.tolist())}')
+        out.append('{' + ', '.join(fields) + '}')
+    return '[' + ', '.join(out) + ']'
+
+
+def _payload_fields(df, lat_col, lon_col, columns):
+    # Cada fila lleva las columnas del popup y, si no están entre ellas, las coordenadas al final
+    fields = list(columns) + [col for col in (lat_col, lon_col) if col not in columns]
+    rows = df[fields].to_json(orient='values', date_format='iso', default_handler=str)
+    return (f'"columns": {json.dumps([str(col) for col in columns])}, '
+            f'"lat": {fields.index(lat_col)}, "lon": {fields.index(lon_col)}, "rows": {rows}')
+
+
+def bulk_payload(df, lat_col, lon_col, columns):
+    payload = '{' + _payload_fields(df, lat_col, lon_col, columns) + '}'
+    # Un valor con "</script>" cerraría el bloque de código del HTML
+    return payload.replace('</', '<\\/')
+
+
+def live_payload(df, lat_col, lon_col, columns, rows, previous=None, cluster=True):
+    # Datos para LiveMarkers: las filas de rows (posiciones en df) que no estaban en
+    # previous, las de previous que ya no están y, con agrupación, los niveles por zoom
+    # del conjunto completo. Sin previous se mandan todas las filas.
+    rows = np.asarray(rows, dtype=np.int64)
+    if previous is None:
+        added, removed = rows, np.zeros(0, dtype=np.int64)
+    else:
+        added = np.setdiff1d(rows, previous, assume_unique=True)
+        removed = np.setdiff1d(previous, rows, assume_unique=True)
+    parts = [
+        f'"ids": {json.dumps(added.tolist())}',
+        f'"removed": {json.dumps(removed.tolist())}',
+        _payload_fields(df.iloc[added], lat_col, lon_col, columns),
+    ]
+    lat = df[lat_col].to_numpy(dtype='float64')[rows]
+    lon = df[lon_col].to_numpy(dtype='float64')[rows]
+    if cluster:
+        levels, detail_zoom = cluster_levels(lat, lon)
+        for level in levels:
+            # cluster_levels da posiciones dentro de rows; la página usa posiciones en df
+            level['first'] = rows[level['first']]
+        parts.append(f'"levels": {levels_payload(levels)}, "detail_zoom": {detail_zoom}')
+    if len(rows) and not np.isnan(lat).all():
+        bounds = [[np.nanmin(lat), np.nanmin(lon)], [np.nanmax(lat), np.nanmax(lon)]]
+        parts.append(f'"bounds": {json.dumps(bounds)}')
+    return ('{' + ', '.join(parts) + '}').replace('</', '<\\/')
+
+
+def _add_markers(m, df, lat_col, lon_col, columns, cluster, color, random_colors):
+    # Un folium.Marker por fila, con el ícono de siempre; solo para pocos puntos
+    target = MarkerCluster().add_to(m) if cluster else m
+    popups = describe_rows(df, columns, html=True)
+    for lat, lon, popup_content in zip(df[lat_col], df[lon_col], popups):
+        marker_color = f"#{random.randint(0, 0xFFFFFF):06x}" if random_colors else color
+        folium.Marker(
+            [lat, lon],
+            popup=folium.Popup(popup_content, max_width=300),
+            icon=folium.Icon(color=marker_color, icon="info-sign")
+        ).add_to(target)
+
+
+def add_points(m, df, lat_col, lon_col, columns, cluster=True, color='#3388ff', random_colors=False):
+    # columns: columnas de los popups, ver geo_core.popup_columns
+    if len(df) < BULK_MIN_POINTS:
+        _add_markers(m, df, lat_col, lon_col, columns, cluster, color, random_colors)
+        return
+    payload = bulk_payload(df, lat_col, lon_col, columns)
+    if cluster:
+        # Las posiciones de cluster_levels son filas del bloque de datos
+        levels, detail_zoom = cluster_levels(df[lat_col].to_numpy(dtype='float64'),
+                                             df[lon_col].to_numpy(dtype='float64'))
+        LodMarkers(payload, levels, detail_zoom, color=color, random_colors=random_colors).add_to(m)
+    else:
+        BulkMarkers(payload, cluster=False, color=color, random_colors=random_colors).add_to(m)
+
+
+def open_map_cache():
+    # Sin un directorio escribible los mapas se generan sin caché (ver cached_map)
+    try:
+        return DiskCache(default_cache_dir('maps'), MAP_CACHE_MAX_BYTES)
+    except OSError as e:
+        print(f"Caché de mapas desactivada: {e}")
+        return None
+
+
+def _temp_map(m):
+    temp_map_file = tempfile.NamedTemporaryFile(delete=False, suffix='.html')
+    temp_map_file.close()
+    m.save(temp_map_file.name)
+    return temp_map_file.name
+
+
+def cached_map(cache, key_parts, build):
+    # HTML del mapa guardado por una clave armada con todo lo que lo determina (huella del
+    # archivo, filtros y opciones). build() arma el folium.Map solo si no está en la caché.
+    # Devuelve la ruta del HTML y si fue un acierto. Sin caché, o si no se puede escribir
+    # en ella, el mapa se guarda en un archivo temporal.
+    if cache is None:
+        return _temp_map(build()), False
+    material = repr((MAP_CACHE_VERSION,) + tuple(key_parts))
+    key = hashlib.sha1(material.encode('utf-8')).hexdigest() + '.html'
+    try:
+        path = cache.get(key)
+    except OSError as e:
+        print(f"No se pudo leer la caché de mapas: {e}")
+        return _temp_map(build()), False
+    if path is not None:
+        return path, True
+    m = build()
+    tmp_path = cache.reserve(key)
+    try:
+        m.save(tmp_path)
+        return cache.commit(key, tmp_path), False
+    except OSError as e:
+        print(f"No se pudo guardar el mapa en la caché: {e}")
+        # Si la falla fue al liberar espacio, la entrada ya quedó publicada
+        path = cache.path_for(key)
+        return (path, False) if os.path.exists(path) else (_temp_map(m), False)
+    finally:
+        cache.discard(tmp_path)
+
+
+def describe_cache(cache):
+    if cache is None:
+        return 'caché de mapas desactivada'
+    return f'caché de mapas: {cache.hits} aciertos, {cache.misses} fallos'
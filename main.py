@@ -1,17 +1,82 @@
 import sys
 import os
-from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QLabel, QMainWindow, QHBoxLayout, QSpacerItem, QSizePolicy
+import argparse
+import importlib
+import time
+from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QPushButton, QLabel, QMainWindow, QHBoxLayout,
+                             QSpacerItem, QSizePolicy, QCheckBox, QMessageBox)
 from PyQt5.QtGui import QPixmap, QFont
-from PyQt5.QtCore import Qt, QTimer, QDateTime
+from PyQt5.QtCore import Qt, QTimer, QDateTime, QProcess
+
+# Las herramientas (que deben estar en el mismo directorio o en el PYTHONPATH) se importan
+# recién al abrirlas: así el menú aparece sin esperar a pandas, matplotlib, folium, boto3
+# ni QtWebEngine. Cada módulo expone open_window() para abrirse dentro de este proceso.
+TOOLS = {
+    'EcohAntenas': 'EcohAntenas',
+    'EcohGeo': 'EcohGeo',
+    'AWS Rekognition': 'aws_rekognition_app',
+}
+# Línea que escribe una herramienta en proceso aparte cuando su ventana ya está visible
+READY_PREFIX = 'ecoh-ready'
+
+
+def resident_memory():
+    # Memoria residente del proceso en bytes, o None si no se puede leer en este sistema
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Sin /proc solo queda el pico; ru_maxrss viene en bytes en macOS y en KB en Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def describe_startup(name, seconds, memory, separate):
+    where = 'en proceso aparte' if separate else 'en este proceso'
+    text = f'{name} abierto {where} en {seconds:.2f} s'
+    if memory is not None:
+        text += f', {memory / 1e6:,.0f} MB' if separate else f', +{memory / 1e6:,.0f} MB'
+    return text + '.'
+
+
+def open_tool(name):
+    # Importa la herramienta y abre su ventana. Devuelve (ventana, segundos, bytes de memoria sumados).
+    memory = resident_memory()
+    start = time.perf_counter()
+    window = importlib.import_module(TOOLS[name]).open_window()
+    seconds = time.perf_counter() - start
+    if memory is not None:
+        memory = resident_memory() - memory
+    return window, seconds, memory
+
+
+def run_tool_process(name, quit_when_ready=False):
+    # Punto de entrada de "main.py --tool NOMBRE": la herramienta sola en su propio proceso
+    QApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
+    app = QApplication(sys.argv)
+    window, seconds, _ = open_tool(name)
+
+    def ready():
+        memory = resident_memory()
+        print(f'{READY_PREFIX} {seconds:.6f} {memory if memory is not None else -1}', flush=True)
+        if quit_when_ready:
+            app.quit()
+
+    # Se avisa desde el bucle de eventos, cuando la ventana ya se dibujó
+    QTimer.singleShot(0, ready)
+    return app.exec_()
 
-# Importa tus scripts (asegúrate de que estén en el mismo directorio o en el PYTHONPATH)
-import EcohAntenas
-import EcohGeo
-import aws_rekognition_app
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
+        self.windows = []  # Herramientas abiertas en este proceso
+        self.processes = {}  # QProcess de cada herramienta en proceso aparte -> (nombre, inicio)
         self.initUI()
 
     def initUI(self):
@@ -54,6 +119,14 @@ class MainWindow(QMainWindow):
 
         main_layout.addLayout(menu_layout)
 
+        # En proceso aparte cada herramienta usa su propio núcleo y si se cae no arrastra al menú
+        self.separate_process_cb = QCheckBox('Abrir cada herramienta en un proceso aparte')
+        self.separate_process_cb.setChecked(True)
+        main_layout.addWidget(self.separate_process_cb)
+
+        self.status_label = QLabel()
+        main_layout.addWidget(self.status_label)
+
         # Footer con fecha y hora
         self.footer_label = QLabel()
         self.footer_label.setAlignment(Qt.AlignRight)
@@ -71,16 +144,91 @@ class MainWindow(QMainWindow):
         formatted_datetime = current_datetime.toString('dd/MM/yyyy hh:mm:ss')
         self.footer_label.setText(formatted_datetime)
 
+    def run_tool(self, name):
+        if self.separate_process_cb.isChecked():
+            self.start_tool_process(name)
+            return
+        # La primera vez importa el módulo, lo que puede tardar unos segundos
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            window, seconds, memory = open_tool(name)
+        except Exception as e:
+            self.status_label.setText(f'No se pudo abrir {name}: {e}')
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        self.windows = [w for w in self.windows if w.isVisible()] + [window]
+        self.status_label.setText(describe_startup(name, seconds, memory, separate=False))
+
+    def start_tool_process(self, name):
+        process = QProcess(self)
+        process.setProcessChannelMode(QProcess.ForwardedErrorChannel)
+        process.readyReadStandardOutput.connect(lambda: self.read_tool_output(process))
+        process.finished.connect(lambda code, status: self.tool_finished(process, code, status))
+        self.processes[process] = (name, time.perf_counter())
+        self.status_label.setText(f'Abriendo {name}...')
+        process.start(sys.executable, [os.path.abspath(__file__), '--tool', name])
+
+    def read_tool_output(self, process):
+        name, start = self.processes[process]
+        while process.canReadLine():
+            line = bytes(process.readLine()).decode('utf-8', 'replace').strip()
+            if line.startswith(READY_PREFIX):
+                memory = int(line.split()[2])
+                self.status_label.setText(describe_startup(name, time.perf_counter() - start,
+                                                           memory if memory >= 0 else None, separate=True))
+            elif line:
+                print(f'[{name}] {line}')
+
+    def tool_finished(self, process, code, status):
+        name, _ = self.processes.pop(process)
+        if status == QProcess.CrashExit or code != 0:
+            self.status_label.setText(f'{name} terminó con error (código {code}).')
+        process.deleteLater()
+
+    def closeEvent(self, event):
+        # Los procesos de las herramientas terminan junto con el menú: se pide confirmación
+        # para no cortar sin aviso un análisis en curso
+        if self.processes:
+            names = ', '.join(name for name, _ in self.processes.values())
+            answer = QMessageBox.question(
+                self, 'Cerrar menú',
+                f'Hay herramientas abiertas en procesos aparte ({names}). '
+                'Si cierra el menú también se cerrarán. ¿Cerrar de todos modos?',
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if answer != QMessageBox.Yes:
+                event.ignore()
+                return
+            for process in list(self.processes):
+                # No se informa como error una herramienta que se cerró a pedido
+                process.finished.disconnect()
+                process.terminate()
+                if not process.waitForFinished(3000):
+                    process.kill()
+                    process.waitForFinished(1000)
+        event.accept()
+
     def run_ecoh_antenas(self):
-        EcohAntenas.main()
+        self.run_tool('EcohAntenas')
 
     def run_ecoh_geo(self):
-        EcohGeo.main()
+        self.run_tool('EcohGeo')
 
     def run_aws_rekognition(self):
-        aws_rekognition_app.main()
+        self.run_tool('AWS Rekognition')
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tool', choices=list(TOOLS), help='abrir solo esta herramienta')
+    parser.add_argument('--quit-when-ready', action='store_true', help='salir apenas abre (para medir el arranque)')
+    args, qt_args = parser.parse_known_args()
+    if args.tool:
+        sys.argv = sys.argv[:1] + qt_args
+        sys.exit(run_tool_process(args.tool, args.quit_when_ready))
+
+    # EcohGeo importa QtWebEngineWidgets después de crear la aplicación; Qt lo permite
+    # solo si este atributo se fija antes
+    QApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
     app = QApplication(sys.argv)
     main_window = MainWindow()
     main_window.show()